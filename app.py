@@ -1,15 +1,43 @@
 import base64
+import hashlib
+import io
+import json
 import logging
+import math
 import os
 import sys
+import tempfile
+import threading
+import time
+import zipfile
+import zlib
 from collections import Counter
+from collections.abc import Hashable, Iterator
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from functools import lru_cache
 from pathlib import Path
 
 import cv2
 import numpy as np
 from flask import Flask, jsonify, render_template, request
+from PIL import Image, UnidentifiedImageError
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
 from ultralytics import YOLO
 
+from serving import deadline as request_deadline
+from serving import metrics
+from serving.admission import AdmissionStore, Rejected
+from serving.batching import BatchScheduler
+from serving.deadline import CostEstimates, Deadline, DeadlineExceeded
+from serving.jobs import JobRunner, JobStore, QueueFull
+from serving.live import KitTracker, LiveSessionStore, frame_change, frame_shift, frame_thumbnail
+from serving.model_registry import ModelRegistry
+from serving.model_server import ModelClient
+from serving.result_cache import ResultCache
+from serving.single_flight import InflightStore, SingleFlight
+from serving.topology import apply_thread_limits, cpu_limit, plan
+
 # Отключаем логирование Flask и Werkzeug
 logging.getLogger('werkzeug').setLevel(logging.ERROR)
 logging.getLogger('flask').setLevel(logging.ERROR)
@@ -21,7 +49,20 @@ app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 app.logger.disabled = True
 APP_TITLE = "Анализ комплектации дорожной аптечки"
 ALLOWED_EXTENSIONS = {'jpg', 'jpeg', 'png', 'webp'}  # Поддерживаемые форматы изображений
-MODEL = None
+# Режимы ответа /process: image — с аннотированным JPEG (base64), boxes — только боксы
+RENDER_MODES = {'image', 'boxes'}
+ACTIVE_MODEL = None  # (модель, версия): при горячей замене меняются вместе
+MODEL_LOCK = threading.Lock()
+SWAP_LOCK = threading.Lock()  # одна замена модели за раз: прогрев воркера и опрос реестра
+REGISTRY_WATCHER_PID = None  # процесс, в котором запущен опрос реестра моделей
+MODEL_READY = threading.Event()  # модель загружена и прогрета в этом процессе
+BATCHER = None
+RESULT_CACHE = None
+SINGLE_FLIGHT = None
+ADMISSION = None
+BULK_ADMISSION = None
+JOB_RUNNER = None
+LIVE_SESSIONS = None
 
 # ========================= DETECTION SETTINGS =========================
 LOW_CONF = 0.05
@@ -30,6 +71,224 @@ IMG_SIZE = 1280
 MAX_BOX_AREA_RATIO = 0.85
 BANDAGE_GAP_THRESHOLD = 2.0
 
+# ========================= TILED INFERENCE =========================
+# Мелкие предметы (карандаш, пластырь, малый бинт) теряются, когда 12-МП фото
+# сжимается до IMG_SIZE. При TILING_ENABLED=1 полный проход вместо TTA режет фото
+# (уменьшенное до TILE_MAX_SIDE по длинной стороне) на перекрывающиеся тайлы
+# TILE_SIZE и прогоняет их вместе с уменьшенным целым кадром одним батчем.
+TILING_ENABLED = os.environ.get('TILING_ENABLED', '0') == '1'
+TILE_SIZE = int(os.environ.get('TILE_SIZE', 640))
+TILE_OVERLAP = float(os.environ.get('TILE_OVERLAP', 0.2))
+TILE_MAX_SIDE = int(os.environ.get('TILE_MAX_SIDE', 1920))
+TILE_NMS_IOU = 0.5
+# Бокс тайла, касающийся внутренней границы тайла, — обрезанный предмет:
+# целиком он виден в соседнем тайле или в целом кадре
+TILE_EDGE_MARGIN = 0.01
+
+# ========================= BATCHED TTA =========================
+# augment=True ultralytics прогоняет виды фото (масштабы, отражение) по очереди внутри
+# запроса и работает только для torch-бэкенда. При TTA_BATCHED=1 все виды — масштабы
+# TTA_SCALES с отражением по TTA_FLIPS — имеют один размер (уменьшенный вид лежит на
+# сером поле) и идут одним батчем; боксы возвращаются в координаты фото и сливаются
+# NMS или WBF (TTA_FUSION) до фильтра по площади.
+TTA_BATCHED = os.environ.get('TTA_BATCHED', '0') == '1'
+TTA_SCALES = [float(scale) for scale in os.environ.get('TTA_SCALES', '1,0.83,0.67').split(',')]
+TTA_FLIPS = [flip.strip() == '1' for flip in os.environ.get('TTA_FLIPS', '0,1,0').split(',')]
+TTA_FUSION = os.environ.get('TTA_FUSION', 'nms').lower()
+TTA_IOU = 0.5
+
+# ========================= ROI =========================
+# Двухэтапный режим: дешёвый проход на ROI_IMG_SIZE находит область комплекта
+# (объединение уверенных боксов с полями), полный проход идёт только по этой
+# области — меньше пикселей на фон, выше разрешение на предметах. При включённом
+# каскаде область берётся из его быстрого прохода.
+ROI_ENABLED = os.environ.get('ROI_ENABLED', '0') == '1'
+ROI_IMG_SIZE = int(os.environ.get('ROI_IMG_SIZE', 320))
+ROI_MIN_CONF = float(os.environ.get('ROI_MIN_CONF', 0.1))
+ROI_MARGIN = float(os.environ.get('ROI_MARGIN', 0.1))  # поля вокруг объединения боксов, доля его размера
+ROI_MIN_SIDE = 0.4  # область не уже этой доли ширины/высоты фото
+ROI_MAX_AREA_RATIO = 0.8  # область почти во весь кадр — кадрировать незачем
+
+# ========================= DECODING =========================
+# Крупные фото сразу декодируются в уменьшенном масштабе (1/2, 1/4, 1/8),
+# но так, чтобы длинная сторона оставалась не меньше DECODE_MIN_SIDE:
+# модель всё равно смотрит на изображение в IMG_SIZE (или в тайлах до TILE_MAX_SIDE).
+# В режиме ROI запас вдвое больше: кадрированная область не должна быть мельче IMG_SIZE.
+DECODE_MIN_SIDE = int(os.environ.get('DECODE_MIN_SIDE', max(
+    IMG_SIZE,
+    TILE_MAX_SIDE if TILING_ENABLED else 0,
+    2 * IMG_SIZE if ROI_ENABLED else 0,
+)))
+REDUCED_DECODE_FLAGS = {
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+}
+
+# ========================= CLIENT UPLOAD =========================
+# Веб-страница сама уменьшает фото до UPLOAD_MAX_SIDE по длинной стороне (с учётом
+# EXIF-ориентации) и перекодирует его перед отправкой: крупнее DECODE_MIN_SIDE
+# сервер фото всё равно не использует, а исходные 5–15 МБ по 3G грузятся долго.
+# Настройки страница получает из GET /upload-config.
+UPLOAD_MAX_SIDE = int(os.environ.get('UPLOAD_MAX_SIDE', DECODE_MIN_SIDE))
+UPLOAD_FORMAT = os.environ.get('UPLOAD_FORMAT', 'jpeg').lower()  # jpeg или webp
+UPLOAD_QUALITY = float(os.environ.get('UPLOAD_QUALITY', 0.9))
+
+# ========================= UPLOAD PRE-CHECK =========================
+# Дешёвые проверки до дорогих этапов: формат и размеры — по заголовку файла до
+# декодирования, резкость и экспозиция — по миниатюре до инференса. Фото, которое
+# модель заведомо не разберёт, получает ответ 422 с подсказкой, что исправить.
+# Нулевое значение порога отключает соответствующую проверку.
+# MPO — JPEG с дополнительными кадрами (так Pillow определяет многие снимки с телефонов)
+IMAGE_FORMATS = {'JPEG', 'MPO', 'PNG', 'WEBP'}
+MAX_IMAGE_PIXELS = int(os.environ.get('MAX_IMAGE_PIXELS', 50_000_000))
+MIN_IMAGE_SIDE = int(os.environ.get('MIN_IMAGE_SIDE', 320))
+QUALITY_THUMBNAIL_SIDE = 256
+# Дисперсия лапласиана миниатюры: резкое фото — сотни и тысячи, сильно размытое — единицы
+QUALITY_MIN_SHARPNESS = float(os.environ.get('QUALITY_MIN_SHARPNESS', 15))
+QUALITY_MIN_BRIGHTNESS = float(os.environ.get('QUALITY_MIN_BRIGHTNESS', 20))
+QUALITY_MAX_BRIGHTNESS = float(os.environ.get('QUALITY_MAX_BRIGHTNESS', 240))
+
+# ========================= INFERENCE BATCHING =========================
+# Параллельные запросы объединяются в один вызов model.predict.
+# INFERENCE_BATCH_SIZE=1 отключает батчинг.
+INFERENCE_BATCH_SIZE = int(os.environ.get('INFERENCE_BATCH_SIZE', 4))
+INFERENCE_BATCH_WAIT_MS = float(os.environ.get('INFERENCE_BATCH_WAIT_MS', 5))
+MODEL_STRIDE = 32  # наибольший шаг сети YOLO: стороны входа модели кратны ему
+
+# ========================= MODEL SERVER =========================
+# Сокеты отдельного процесса инференса (через запятую — пул). Если заданы, воркер
+# не загружает веса: изображения уходят серверу модели через общую память.
+# Под gunicorn задаётся из gunicorn.conf.py при MODEL_SERVER=1.
+MODEL_SERVER_SOCKET = os.environ.get('MODEL_SERVER_SOCKET', '')
+MODEL_SERVER_CONNECT_TIMEOUT = float(os.environ.get('MODEL_SERVER_CONNECT_TIMEOUT', 120))
+
+# ========================= MODEL REGISTRY =========================
+# Каталог версий весов с manifest.json (python -m scripts.model_registry). Если задан,
+# модель — активная версия реестра, и каждый процесс раз в MODEL_REGISTRY_POLL секунд
+# проверяет manifest: новая версия загружается и прогревается в фоне, затем подменяет
+# текущую целиком; запросы, уже получившие прежнюю модель, дорабатывают на ней.
+MODEL_REGISTRY_DIR = os.environ.get('MODEL_REGISTRY_DIR', '')
+MODEL_REGISTRY_POLL = float(os.environ.get('MODEL_REGISTRY_POLL', 5))
+# Мастер gunicorn держит модель только для copy-on-write и версии не переключает
+MODEL_REGISTRY_WATCH = True
+
+# ========================= INFERENCE THREADS =========================
+# Потоки torch в процессе. Под gunicorn INFERENCE_THREADS выставляет gunicorn.conf.py
+# по общей топологии; при запуске python app.py процессу отдаются все доступные CPU.
+INFERENCE_THREADS = int(os.environ.get('INFERENCE_THREADS', 0)) or plan(
+    cpu_limit(), max_workers=1, batch_size=INFERENCE_BATCH_SIZE
+).inference_threads
+apply_thread_limits(INFERENCE_THREADS)
+
+# ========================= INFERENCE BACKEND =========================
+# torch — исходные веса best.pt; onnx / openvino — экспортированные версии
+# тех же весов (см. python -m scripts.export_model), лежащие рядом с best.pt;
+# openvino-int8 — квантованная модель (python -m scripts.quantize_model).
+INFERENCE_BACKEND = os.environ.get('INFERENCE_BACKEND', 'torch').lower()
+BACKEND_ARTIFACTS = {
+    'torch': '.pt',
+    'onnx': '.onnx',
+    'openvino': '_openvino_model',
+    'openvino-int8': '_int8_openvino_model',
+}
+
+# ========================= CASCADE =========================
+# Сначала дешёвый проход без TTA на CASCADE_FAST_IMG_SIZE; полный TTA@IMG_SIZE
+# запускается, только если комплект неполный, разделение бинтов неоднозначно
+# или в итог попали боксы из нижнего (low confidence) уровня two_tier_filter.
+CASCADE_ENABLED = os.environ.get('CASCADE_ENABLED', '0') == '1'
+CASCADE_FAST_IMG_SIZE = int(os.environ.get('CASCADE_FAST_IMG_SIZE', 640))
+# Разрыв площадей бинтов в пределах [порог / k, порог * k] считается неоднозначным
+CASCADE_BANDAGE_GAP_MARGIN = 1.25
+
+# ========================= DEADLINES =========================
+# Бюджет задержки /process, с. Чем меньше его осталось к началу инференса, тем дешевле
+# уровень качества; не успевающий запрос отменяется с 503, а не убивается таймаутом
+# gunicorn. Отсчёт — от заголовка X-Request-Start прокси, иначе от начала обработки.
+# 0 — без бюджета.
+REQUEST_BUDGET = float(os.environ.get('REQUEST_BUDGET', 0))
+DEGRADED_IMG_SIZE = int(os.environ.get('DEGRADED_IMG_SIZE', 640))
+DEADLINE_SAFETY = 1.5  # запас к оценке длительности уровня
+DEADLINE_RETRY_AFTER = 5  # Retry-After ответа 503, с
+# Уровни от дорогого к дешёвому: (imgsz, TTA, рисовать боксы на сервере);
+# full — настроенный пайплайн целиком (каскад, ROI, тайлы)
+QUALITY_LEVELS = {
+    'full': (IMG_SIZE, True, True),
+    'no_tta': (IMG_SIZE, False, True),
+    'low_res': (DEGRADED_IMG_SIZE, False, False),
+}
+QUALITY_COSTS = CostEstimates()
+
+# ========================= RESULT CACHE =========================
+# Повторная отправка того же фото (ретрай, двойной тап) отдаёт сохранённый
+# ответ без инференса. Кэш общий для воркеров gunicorn: SQLite в STATE_DIR.
+STATE_DIR = Path(os.environ.get('STATE_DIR', Path(tempfile.gettempdir()) / 'medkit'))
+RESULT_CACHE_ENABLED = os.environ.get('RESULT_CACHE_ENABLED', '1') == '1'
+RESULT_CACHE_MAX_ENTRIES = int(os.environ.get('RESULT_CACHE_MAX_ENTRIES', 256))
+RESULT_CACHE_MAX_MB = int(os.environ.get('RESULT_CACHE_MAX_MB', 256))
+RESULT_CACHE_TTL = float(os.environ.get('RESULT_CACHE_TTL', 3600))
+
+# ========================= SINGLE-FLIGHT =========================
+# Одинаковые фото (тот же ключ, что у кэша результатов), присланные одновременно,
+# проверяются один раз: повторы ждут результат первого. Между воркерами — через
+# отметку в общей базе STATE_DIR и кэш результатов (без кэша — только внутри воркера).
+SINGLE_FLIGHT_ENABLED = os.environ.get('SINGLE_FLIGHT_ENABLED', '1') == '1'
+SINGLE_FLIGHT_MAX_WAIT = float(os.environ.get('SINGLE_FLIGHT_MAX_WAIT', 120))  # дольше — проверяем сами
+
+# ========================= ASYNC JOBS =========================
+# POST /jobs ставит фото в ограниченную очередь воркера и сразу возвращает id;
+# при переполненной очереди — 429 с Retry-After. Статусы задач — в STATE_DIR.
+JOB_QUEUE_SIZE = int(os.environ.get('JOB_QUEUE_SIZE', 8))
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+JOB_TTL = float(os.environ.get('JOB_TTL', 600))
+JOB_MAX_WAIT = float(os.environ.get('JOB_MAX_WAIT', 30))  # предел long-poll, с
+
+# ========================= BULK =========================
+# POST /bulk: много фото (multipart или zip) одним запросом, результаты — NDJSON
+# по мере готовности. Параллельные проверки объединяются микробатчингом.
+BULK_MAX_CONTENT_MB = int(os.environ.get('BULK_MAX_CONTENT_MB', 512))
+BULK_MAX_FILES = int(os.environ.get('BULK_MAX_FILES', 1000))
+BULK_CONCURRENCY = int(os.environ.get('BULK_CONCURRENCY', max(INFERENCE_BATCH_SIZE, 1)))
+
+# ========================= LIVE CAMERA =========================
+# Сессия /live: браузер шлёт уменьшенные кадры с камеры, сервер пропускает почти
+# не изменившиеся кадры, ведёт треки предметов между кадрами (каждый предмет
+# считается один раз) и обновляет чек-лист. Инференс — быстрый, без TTA.
+LIVE_IMG_SIZE = int(os.environ.get('LIVE_IMG_SIZE', 640))
+LIVE_FRAME_SIZE = int(os.environ.get('LIVE_FRAME_SIZE', 640))  # длинная сторона кадра на клиенте
+LIVE_SKIP_DIFF = float(os.environ.get('LIVE_SKIP_DIFF', 4.0))  # среднее различие миниатюр (0–255)
+LIVE_SKIP_SHIFT = float(os.environ.get('LIVE_SKIP_SHIFT', 0.02))  # сдвиг камеры, доля кадра
+LIVE_TRACK_IOU = float(os.environ.get('LIVE_TRACK_IOU', 0.3))
+LIVE_MIN_HITS = int(os.environ.get('LIVE_MIN_HITS', 2))  # в скольких кадрах предмет должен быть виден
+LIVE_SESSION_TTL = float(os.environ.get('LIVE_SESSION_TTL', 600))
+# Большой и малый бинт между кадрами могут меняться местами — это один трек
+LIVE_TRACK_GROUPS = {'Large bandage': 'bandage', 'small bandage': 'bandage'}
+
+# ========================= ADMISSION CONTROL =========================
+# Защита от клиента, забивающего сервис запросами: корзина токенов и предел
+# одновременных проверок на клиента (IP или ключ из RATE_LIMIT_API_KEYS), предел
+# выполняемых и ожидающих в очереди проверок на воркер. Состояние общее для воркеров
+# (SQLite в STATE_DIR); лишние запросы получают 429 с Retry-After.
+ADMISSION_ENABLED = os.environ.get('ADMISSION_ENABLED', '0') == '1'
+RATE_LIMIT_PER_MINUTE = float(os.environ.get('RATE_LIMIT_PER_MINUTE', 30))  # 0 — без ограничения частоты
+RATE_LIMIT_BURST = float(os.environ.get('RATE_LIMIT_BURST', 10))
+CLIENT_MAX_INFLIGHT = int(os.environ.get('CLIENT_MAX_INFLIGHT', 2))
+WORKER_MAX_INFLIGHT = int(os.environ.get('WORKER_MAX_INFLIGHT', 16))  # 0 — без предела
+# Ключи X-API-Key, по которым клиент считается отдельно от IP (например, интеграция за NAT);
+# неизвестный ключ не учитывается — иначе лимит обходился бы сменой ключа
+RATE_LIMIT_API_KEYS = {key.strip() for key in os.environ.get('RATE_LIMIT_API_KEYS', '').split(',') if key.strip()}
+TRUSTED_PROXIES = int(os.environ.get('TRUSTED_PROXIES', 0))  # сколько прокси перед сервисом дописывают X-Forwarded-For
+LIVE_FRAME_COST = 0.1  # токенов за кадр живой проверки (проход без TTA на LIVE_IMG_SIZE)
+# Файлы /bulk тратят отдельную корзину: одна загрузка обычного размера целиком
+# укладывается в её запас, а частота проверок фото от этого не страдает
+BULK_RATE_LIMIT_PER_MINUTE = float(os.environ.get('BULK_RATE_LIMIT_PER_MINUTE', 60))  # 0 — без ограничения
+BULK_RATE_LIMIT_BURST = float(os.environ.get('BULK_RATE_LIMIT_BURST', BULK_MAX_FILES))
+
+# ========================= WARM-UP =========================
+# Сколько прогревочных прогонов на IMG_SIZE делает воркер до приёма запросов
+WARMUP_RUNS = int(os.environ.get('WARMUP_RUNS', 1))
+
 REQUIRED_ITEMS = {
     'Large bandage': 3,
     'small bandage': 3,
@@ -62,6 +321,26 @@ ITEM_NAME_RU = {
     'Tourniquet': 'Жгут',
 }
 
+# Классы комплекта как целые индексы в порядке REQUIRED_ITEMS: постобработка
+# работает с массивами индексов, а не со строками имён
+REQUIRED_NAMES = list(REQUIRED_ITEMS)
+REQUIRED_LIMITS = np.array(list(REQUIRED_ITEMS.values()))
+LARGE_BANDAGE = REQUIRED_NAMES.index('Large bandage')
+SMALL_BANDAGE = REQUIRED_NAMES.index('small bandage')
+BANDAGE_CLASSES = np.array([i for i, name in enumerate(REQUIRED_NAMES) if 'bandage' in name.lower()])
+
+
+class UploadError(ValueError):
+    """Некорректный запрос на проверку фото (ответ 400)."""
+
+
+class ImageRejected(UploadError):
+    """Фото не подходит для анализа (ответ 422); reason — код причины для клиента и метрик."""
+
+    def __init__(self, reason: str, message: str):
+        super().__init__(message)
+        self.reason = reason
+
 
 class DetectedObject:
     def __init__(self, cls_name: str, conf: float, box: np.ndarray):
@@ -74,13 +353,74 @@ class DetectedObject:
         return float((self.box[2] - self.box[0]) * (self.box[3] - self.box[1]))
 
 
+class Detections:
+    """Детекции в виде массивов: индекс класса в REQUIRED_ITEMS, confidence, бокс xyxy, площадь."""
+
+    def __init__(self, cls: np.ndarray, conf: np.ndarray, boxes: np.ndarray, area: np.ndarray | None = None):
+        self.cls = cls
+        self.conf = conf
+        self.boxes = boxes
+        if area is None:
+            area = ((boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])).astype(np.float64)
+        self.area = area
+
+    def __len__(self) -> int:
+        return len(self.cls)
+
+    def take(self, index: np.ndarray) -> 'Detections':
+        """Подмножество по булевой маске или по индексам (в их порядке)."""
+        return Detections(self.cls[index], self.conf[index], self.boxes[index], self.area[index])
+
+    def shifted(self, dx: float, dy: float) -> 'Detections':
+        """Те же детекции со сдвигом боксов (из координат области в координаты изображения)."""
+        offset = np.array([dx, dy, dx, dy], dtype=self.boxes.dtype)
+        return Detections(self.cls, self.conf, self.boxes + offset, self.area)
+
+    def to_objects(self) -> list[DetectedObject]:
+        return [
+            DetectedObject(REQUIRED_NAMES[cls_idx], conf, box)
+            for cls_idx, conf, box in zip(self.cls.tolist(), self.conf.tolist(), self.boxes, strict=True)
+        ]
+
+
 def allowed_file(filename):
     """Проверка допустимого расширения файла."""
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 
+def read_upload() -> tuple[bytes, str]:
+    """Проверяет форму запроса; возвращает байты фото и режим ответа."""
+    if 'image' not in request.files:
+        raise UploadError('Файл не найден')
+
+    file = request.files['image']
+
+    if file.filename == '':
+        raise UploadError('Файл не выбран')
+
+    if not allowed_file(file.filename):
+        raise UploadError('Недопустимый формат файла')
+
+    render = request.args.get('render', 'image')
+    if render not in RENDER_MODES:
+        raise UploadError('Недопустимый режим ответа')
+
+    with metrics.observe_stage('upload_read'):
+        image_bytes = file.read()
+    return image_bytes, render
+
+
+def get_model_registry() -> ModelRegistry | None:
+    return ModelRegistry(MODEL_REGISTRY_DIR) if MODEL_REGISTRY_DIR else None
+
+
 def get_model_path() -> Path:
-    """Возвращает путь к best.pt (приоритет: корень проекта)."""
+    """Возвращает путь к весам: активная версия реестра, иначе best.pt (приоритет: корень проекта)."""
+    registry = get_model_registry()
+    active = registry.active() if registry is not None else None
+    if active is not None:
+        return active[1]
+
     base_dir = Path(__file__).resolve().parent
     root_best = base_dir / "best.pt"
     if root_best.exists():
@@ -93,153 +433,866 @@ def get_model_path() -> Path:
     raise FileNotFoundError("Файл модели best.pt не найден")
 
 
-def get_model() -> YOLO:
-    """Ленивая загрузка модели YOLO."""
-    global MODEL
-    if MODEL is None:
-        model_path = get_model_path()
-        MODEL = YOLO(str(model_path))
-    return MODEL
+def get_backend_model_path(backend: str = INFERENCE_BACKEND, weights_path: Path | None = None) -> Path:
+    """Возвращает путь к весам для выбранного бэкенда инференса."""
+    if backend not in BACKEND_ARTIFACTS:
+        raise ValueError(f"Неизвестный бэкенд инференса: {backend}")
 
+    weights_path = weights_path or get_model_path()
+    if backend == 'torch':
+        return weights_path
 
-def decode_image_to_bgr(image_bytes: bytes) -> np.ndarray:
-    """Декодирует изображение из байтов в OpenCV BGR."""
+    exported_path = weights_path.with_name(weights_path.stem + BACKEND_ARTIFACTS[backend])
+    if not exported_path.exists():
+        if backend == 'openvino-int8':
+            command = "python -m scripts.quantize_model"
+        else:
+            command = f"python -m scripts.export_model --backend {backend}"
+        raise FileNotFoundError(f"Модель для бэкенда {backend} не найдена: {exported_path.name}. Выполните: {command}")
+    return exported_path
+
+
+def artifact_digest(path: Path) -> str:
+    """SHA-256 файла весов; для каталога экспорта (OpenVINO) — по именам и хэшам всех его файлов."""
+    if not path.is_dir():
+        with open(path, 'rb') as f:
+            return hashlib.file_digest(f, 'sha256').hexdigest()
+    digest = hashlib.sha256()
+    for file_path in sorted(item for item in path.rglob('*') if item.is_file()):
+        digest.update(file_path.relative_to(path).as_posix().encode('utf-8'))
+        digest.update(bytes.fromhex(artifact_digest(file_path)))
+    return digest.hexdigest()
+
+
+def model_source() -> tuple[str, Path]:
+    """Версия модели (бэкенд и версия реестра или хэш весов) и путь к исходным весам.
+
+    Без реестра хэшируется то, что загружает бэкенд: после повторного экспорта или
+    квантизации версия, а с ней и ключ кэша результатов, меняется.
+    """
+    registry = get_model_registry()
+    active = registry.active() if registry is not None else None
+    if active is not None:
+        return f"{INFERENCE_BACKEND}-{active[0]}", active[1]
+
+    weights_path = get_model_path()
+    digest = artifact_digest(get_backend_model_path(weights_path=weights_path))
+    return f"{INFERENCE_BACKEND}-{digest[:12]}", weights_path
+
+
+def load_model(weights_path: Path) -> YOLO:
+    """Загружает модель выбранного бэкенда для указанных весов."""
+    model_path = get_backend_model_path(weights_path=weights_path)
+    if INFERENCE_BACKEND != 'torch' and not TTA_BATCHED:
+        print(
+            f"[WARNING] INFERENCE_BACKEND={INFERENCE_BACKEND}: TTA (augment=True) ultralytics выполняет "
+            "только PyTorch, полный проход пойдёт без TTA. Для TTA на этом бэкенде включите TTA_BATCHED=1",
+            flush=True,
+        )
+    started = time.perf_counter()
+    model = YOLO(str(model_path), task='detect')
+    metrics.MODEL_LOAD_SECONDS.set(time.perf_counter() - started)
+    return model
+
+
+def get_active_model() -> tuple[YOLO | ModelClient, str]:
+    """Ленивая загрузка модели; возвращает модель и её версию одной парой.
+
+    Модель может смениться между вызовами, поэтому запрос берёт пару один раз и
+    использует её до конца. Для клиента сервера модели версия — активная на сервере
+    в момент вызова; какая версия ответила на инференс, показывает client.version.
+    """
+    global ACTIVE_MODEL
+    if ACTIVE_MODEL is None:
+        with MODEL_LOCK:
+            if ACTIVE_MODEL is None and MODEL_SERVER_SOCKET:
+                client = ModelClient(MODEL_SERVER_SOCKET.split(','), connect_timeout=MODEL_SERVER_CONNECT_TIMEOUT)
+                ACTIVE_MODEL = (client, None)
+            elif ACTIVE_MODEL is None:
+                version, weights_path = model_source()
+                ACTIVE_MODEL = (load_model(weights_path), version)
+                if MODEL_REGISTRY_WATCH:
+                    metrics.MODEL_VERSION.labels(version).set(1)
+
+    model, version = ACTIVE_MODEL
+    if isinstance(model, ModelClient):
+        return model, model.current_version()
+    if MODEL_REGISTRY_DIR and MODEL_REGISTRY_WATCH and os.getpid() != REGISTRY_WATCHER_PID:
+        start_registry_watcher()
+    return model, version
+
+
+def get_model() -> YOLO | ModelClient:
+    """Ленивая загрузка модели YOLO для выбранного бэкенда (или клиент сервера модели)."""
+    return get_active_model()[0]
+
+
+def swap_model() -> str | None:
+    """Загружает и прогревает активную версию реестра и подменяет ею текущую модель.
+
+    Возвращает новую версию или None, если она уже активна.
+    """
+    global ACTIVE_MODEL
+    # Без блокировки прогрев воркера и поток опроса реестра при старте грузили бы одну
+    # версию дважды; запросы при этом работают на текущей модели под MODEL_LOCK
+    with SWAP_LOCK:
+        version, weights_path = model_source()
+        if ACTIVE_MODEL is not None and ACTIVE_MODEL[1] == version:
+            return None
+
+        model = load_model(weights_path)
+        warm_up(model)
+        with MODEL_LOCK:
+            previous = ACTIVE_MODEL[1] if ACTIVE_MODEL is not None else None
+            ACTIVE_MODEL = (model, version)
+    metrics.MODEL_VERSION.labels(version).set(1)
+    if previous is not None:
+        metrics.MODEL_VERSION.labels(previous).set(0)
+    metrics.MODEL_SWAPS.labels('success').inc()
+    print(f"[INFO] Process {os.getpid()}: model {previous} -> {version}", flush=True)
+    return version
+
+
+def watch_model_registry() -> None:
+    """Фоновый опрос manifest.json; при изменении — горячая замена модели."""
+    registry = get_model_registry()
+    stamp = None
+    while True:
+        time.sleep(MODEL_REGISTRY_POLL)
+        current = registry.stamp()
+        if current == stamp:
+            continue
+        stamp = current
+        try:
+            swap_model()
+        except Exception as e:
+            # Битая версия не должна ронять процесс: продолжаем работать на текущей
+            metrics.MODEL_SWAPS.labels('failed').inc()
+            print(f"[ERROR] Process {os.getpid()}: model swap failed: {e}", flush=True)
+
+
+def start_registry_watcher() -> None:
+    """Запускает опрос реестра в текущем процессе (поток мастера не переживает fork)."""
+    global REGISTRY_WATCHER_PID
+    with MODEL_LOCK:
+        if os.getpid() == REGISTRY_WATCHER_PID:
+            return
+        REGISTRY_WATCHER_PID = os.getpid()
+    threading.Thread(target=watch_model_registry, name='model-registry', daemon=True).start()
+
+
+def detection_settings() -> dict:
+    """Настройки, от которых зависит результат детекции."""
+    return {
+        'low_conf': LOW_CONF,
+        'high_conf': HIGH_CONF,
+        'img_size': IMG_SIZE,
+        'decode_min_side': DECODE_MIN_SIDE,
+        'max_box_area_ratio': MAX_BOX_AREA_RATIO,
+        'bandage_gap_threshold': BANDAGE_GAP_THRESHOLD,
+        'cascade': [CASCADE_ENABLED, CASCADE_FAST_IMG_SIZE],
+        'tiling': [TILING_ENABLED, TILE_SIZE, TILE_OVERLAP, TILE_MAX_SIDE],
+        'tta': [TTA_BATCHED, TTA_SCALES, TTA_FLIPS, TTA_FUSION],
+        'roi': [ROI_ENABLED, ROI_IMG_SIZE, ROI_MIN_CONF, ROI_MARGIN],
+        'required_items': REQUIRED_ITEMS,
+    }
+
+
+def result_cache_key(image_bytes: bytes, render: str, model_version: str) -> str:
+    """Ключ кэша: хэш содержимого файла, версии модели, настроек детекции и режима ответа."""
+    digest = hashlib.sha256(image_bytes)
+    digest.update(model_version.encode('utf-8'))
+    digest.update(render.encode('utf-8'))
+    digest.update(json.dumps(detection_settings(), sort_keys=True).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def get_job_runner() -> JobRunner:
+    """Ленивое создание очереди асинхронных задач."""
+    global JOB_RUNNER
+    if JOB_RUNNER is None:
+        JOB_RUNNER = JobRunner(
+            JobStore(STATE_DIR / 'jobs.sqlite3', ttl=JOB_TTL),
+            run_job,
+            max_queue=JOB_QUEUE_SIZE,
+            workers=JOB_WORKERS,
+            name='inspection-job',
+            on_wait=metrics.queue_wait_observer('jobs'),
+        )
+    return JOB_RUNNER
+
+
+def get_result_cache() -> ResultCache:
+    """Ленивое открытие кэша результатов."""
+    global RESULT_CACHE
+    if RESULT_CACHE is None:
+        RESULT_CACHE = ResultCache(
+            STATE_DIR / 'result_cache.sqlite3',
+            max_entries=RESULT_CACHE_MAX_ENTRIES,
+            max_bytes=RESULT_CACHE_MAX_MB * 1024 * 1024,
+            ttl=RESULT_CACHE_TTL,
+        )
+    return RESULT_CACHE
+
+
+def get_single_flight() -> SingleFlight:
+    """Ленивое создание объединителя одинаковых одновременных проверок."""
+    global SINGLE_FLIGHT
+    if SINGLE_FLIGHT is None:
+        store = None
+        if RESULT_CACHE_ENABLED:
+            store = InflightStore(STATE_DIR / 'inflight.sqlite3', max_age=SINGLE_FLIGHT_MAX_WAIT)
+        SINGLE_FLIGHT = SingleFlight(store, max_wait=SINGLE_FLIGHT_MAX_WAIT)
+    return SINGLE_FLIGHT
+
+
+def get_admission() -> AdmissionStore:
+    """Ленивое открытие общего состояния контроля допуска."""
+    global ADMISSION
+    if ADMISSION is None:
+        ADMISSION = AdmissionStore(
+            STATE_DIR / 'admission.sqlite3',
+            rate=RATE_LIMIT_PER_MINUTE / 60,
+            burst=RATE_LIMIT_BURST,
+            client_max_inflight=CLIENT_MAX_INFLIGHT,
+            worker_max_inflight=WORKER_MAX_INFLIGHT,
+        )
+    return ADMISSION
+
+
+def get_bulk_admission() -> AdmissionStore:
+    """Ленивое открытие корзин токенов файлов /bulk (билеты /bulk — в get_admission())."""
+    global BULK_ADMISSION
+    if BULK_ADMISSION is None:
+        BULK_ADMISSION = AdmissionStore(
+            STATE_DIR / 'bulk_admission.sqlite3',
+            rate=BULK_RATE_LIMIT_PER_MINUTE / 60,
+            burst=BULK_RATE_LIMIT_BURST,
+        )
+    return BULK_ADMISSION
+
+
+def get_live_sessions() -> LiveSessionStore:
+    """Ленивое открытие хранилища сессий живой проверки."""
+    global LIVE_SESSIONS
+    if LIVE_SESSIONS is None:
+        LIVE_SESSIONS = LiveSessionStore(STATE_DIR / 'live.sqlite3', ttl=LIVE_SESSION_TTL)
+    return LIVE_SESSIONS
+
+
+def read_image_size(image_bytes: bytes) -> tuple[int, int] | None:
+    """Ширина и высота из заголовка изображения (пиксели не декодируются)."""
+    try:
+        with Image.open(io.BytesIO(image_bytes)) as img:
+            return img.size
+    except (UnidentifiedImageError, OSError):
+        return None
+
+
+def sniff_image(image_bytes: bytes) -> tuple[int, int]:
+    """Формат и размеры по заголовку файла; отклоняет то, что не стоит декодировать.
+
+    Возвращает ширину и высоту (без учёта EXIF-ориентации).
+    """
+    try:
+        with Image.open(io.BytesIO(image_bytes)) as img:
+            image_format, (width, height) = img.format, img.size
+    except Image.DecompressionBombError:
+        raise ImageRejected(
+            'too_large', f'Слишком большое изображение: допустимо до {MAX_IMAGE_PIXELS / 1e6:.3g} МП. Уменьшите фото'
+        ) from None
+    except (UnidentifiedImageError, OSError):
+        image_format = None
+    if image_format not in IMAGE_FORMATS:
+        raise ImageRejected('unsupported_format', 'Файл не является изображением JPEG, PNG или WebP')
+
+    if MAX_IMAGE_PIXELS and width * height > MAX_IMAGE_PIXELS:
+        raise ImageRejected(
+            'too_large',
+            f'Слишком большое изображение: {width}×{height} ({width * height / 1e6:.3g} МП), '
+            f'допустимо до {MAX_IMAGE_PIXELS / 1e6:.3g} МП. Уменьшите фото',
+        )
+    if max(width, height) < MIN_IMAGE_SIDE:
+        raise ImageRejected(
+            'too_small',
+            f'Слишком маленькое изображение: {width}×{height}. '
+            f'Нужно не меньше {MIN_IMAGE_SIDE} пикселей по длинной стороне',
+        )
+    return width, height
+
+
+def image_quality(image: np.ndarray) -> tuple[float, float]:
+    """Резкость (дисперсия лапласиана) и средняя яркость серой миниатюры."""
+    height, width = image.shape[:2]
+    scale = min(1.0, QUALITY_THUMBNAIL_SIDE / max(height, width))
+    small = cv2.resize(image, (round(width * scale), round(height * scale)), interpolation=cv2.INTER_AREA)
+    gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+    return float(cv2.Laplacian(gray, cv2.CV_64F).var()), float(gray.mean())
+
+
+def quality_issue(image: np.ndarray) -> ImageRejected | None:
+    """Почему по фото нельзя проверить комплект (слишком тёмное, пересвеченное, размытое) или None."""
+    sharpness, brightness = image_quality(image)
+    if QUALITY_MIN_BRIGHTNESS and brightness < QUALITY_MIN_BRIGHTNESS:
+        return ImageRejected('too_dark', 'Фото слишком тёмное: включите свет или вспышку и переснимите аптечку')
+    if QUALITY_MAX_BRIGHTNESS and brightness > QUALITY_MAX_BRIGHTNESS:
+        return ImageRejected('overexposed', 'Фото пересвечено: уберите прямой свет и блики и переснимите аптечку')
+    # Резкость проверяется после экспозиции: у тёмного фото лапласиан мал и без размытия
+    if QUALITY_MIN_SHARPNESS and sharpness < QUALITY_MIN_SHARPNESS:
+        return ImageRejected(
+            'blurry', 'Фото размыто: держите телефон неподвижно, дождитесь фокусировки и переснимите аптечку'
+        )
+    return None
+
+
+def decode_scale(width: int, height: int) -> int:
+    """Наибольший знаменатель масштаба, при котором длинная сторона не меньше DECODE_MIN_SIDE."""
+    long_side = max(width, height)
+    for scale in sorted(REDUCED_DECODE_FLAGS, reverse=True):
+        if long_side // scale >= DECODE_MIN_SIDE:
+            return scale
+    return 1
+
+
+def decode_image_to_bgr(image_bytes: bytes, size: tuple[int, int] | None = None) -> np.ndarray:
+    """Декодирует изображение из байтов в OpenCV BGR.
+
+    EXIF-ориентация применяется при декодировании; крупные изображения
+    декодируются сразу в уменьшенном масштабе (для JPEG — средствами libjpeg).
+    size — размеры из заголовка, если он уже прочитан.
+    """
     np_buffer = np.frombuffer(image_bytes, np.uint8)
-    bgr_img = cv2.imdecode(np_buffer, cv2.IMREAD_COLOR)
+    size = size or read_image_size(image_bytes)
+    scale = decode_scale(*size) if size else 1
+    bgr_img = cv2.imdecode(np_buffer, REDUCED_DECODE_FLAGS.get(scale, cv2.IMREAD_COLOR))
     if bgr_img is None:
         raise ValueError("Не удалось прочитать изображение")
     return bgr_img
 
 
-def raw_detect(model: YOLO, image: np.ndarray, img_area: float) -> list[DetectedObject]:
-    """Сырая детекция объектов с базовой фильтрацией."""
-    results = model.predict(
-        image,
-        conf=LOW_CONF,
-        iou=0.5,
-        imgsz=IMG_SIZE,
-        augment=True,
-        verbose=False,
-    )[0]
-
-    relevant_classes = set(REQUIRED_ITEMS.keys())
-    objects: list[DetectedObject] = []
+@lru_cache(maxsize=8)
+def _class_lookup(names: tuple[tuple[int, str], ...]) -> np.ndarray:
+    lookup = np.full(max(cls_id for cls_id, _ in names) + 1, -1, dtype=np.int64)
+    for cls_id, name in names:
+        if name in REQUIRED_ITEMS:
+            lookup[cls_id] = REQUIRED_NAMES.index(name)
+    return lookup
+
+
+def class_lookup(names: dict[int, str]) -> np.ndarray:
+    """Таблица «id класса модели → индекс в REQUIRED_ITEMS» (-1 — класс не входит в комплект)."""
+    return _class_lookup(tuple(names.items()))
+
+
+def predict_batch(model: YOLO, images: list[np.ndarray], imgsz: int, augment: bool) -> list:
+    """Один вызов model.predict для списка изображений."""
+    request_deadline.check('predict')
+    metrics.BATCH_SIZE.observe(len(images))
+    with metrics.observe_stage('predict'):
+        return model.predict(
+            images,
+            conf=LOW_CONF,
+            iou=0.5,
+            imgsz=imgsz,
+            augment=augment,
+            # Классы вне комплекта (например, Medical wipes) отбрасываются до NMS
+            classes=np.flatnonzero(class_lookup(model.names) >= 0).tolist(),
+            verbose=False,
+        )
+
+
+def _run_predict_batch(key: Hashable, items: list) -> list:
+    model, imgsz, augment, group, _shapes = key
+    if not group:
+        return predict_batch(model, items, imgsz, augment)
+
+    # Элемент — группа изображений одного запроса (тайлы фото, кадры с сервера модели);
+    # изображения всех групп батча идут одним вызовом
+    results = predict_batch(model, [image for images in items for image in images], imgsz, augment)
+    grouped, start = [], 0
+    for images in items:
+        grouped.append(results[start:start + len(images)])
+        start += len(images)
+    return grouped
+
+
+def _observe_batch_waits(waits: list[float]) -> None:
+    for waited in waits:
+        metrics.QUEUE_WAIT_SECONDS.labels('inference_batch').observe(waited)
+
+
+def get_batcher() -> BatchScheduler:
+    """Ленивое создание планировщика микробатчей."""
+    global BATCHER
+    if BATCHER is None:
+        BATCHER = BatchScheduler(
+            _run_predict_batch,
+            max_batch_size=INFERENCE_BATCH_SIZE,
+            max_wait_ms=INFERENCE_BATCH_WAIT_MS,
+            name='inference-batcher',
+            on_batch=_observe_batch_waits,
+        )
+    return BATCHER
+
+
+def predict_remote(client: ModelClient, images: list[np.ndarray], imgsz: int, augment: bool) -> list:
+    """Предсказания сервера модели; батчинг запросов всех воркеров — на его стороне."""
+    deadline = request_deadline.current()
+    with metrics.observe_stage('model_server'):
+        try:
+            return client.predict(images, imgsz=imgsz, augment=augment,
+                                  deadline=None if deadline is None else deadline.expires_at)
+        except (TimeoutError, RuntimeError) as e:
+            # Сервер тоже мог отменить запрос по дедлайну раньше, чем истёк таймаут клиента
+            if deadline is not None and deadline.remaining() <= 0:
+                raise DeadlineExceeded("Сервер модели не ответил в пределах бюджета задержки") from e
+            raise
+
+
+def model_input(image: np.ndarray, imgsz: int) -> tuple[np.ndarray, float, float]:
+    """Кадр в форме входа модели: ресайз, как у letterbox ultralytics, и серое поле справа/снизу до кратного MODEL_STRIDE.
+
+    Батч из кадров разной формы ultralytics дополняет до квадрата imgsz, а из одинаковых —
+    лишь до кратного шагу сети. Фото разного разрешения с одним соотношением сторон после
+    model_input совпадают по форме и батчатся вместе без лишних пикселей. Возвращает вход
+    и масштабы по x и y (боксы результата переводятся обратно restore_result).
+    """
+    height, width = image.shape[:2]
+    ratio = imgsz / max(height, width)
+    new_width, new_height = round(width * ratio), round(height * ratio)
+    if (new_width, new_height) != (width, height):
+        image = cv2.resize(image, (new_width, new_height), interpolation=cv2.INTER_LINEAR)
+    pad_height, pad_width = -new_height % MODEL_STRIDE, -new_width % MODEL_STRIDE
+    if pad_height or pad_width:
+        image = cv2.copyMakeBorder(image, 0, pad_height, 0, pad_width, cv2.BORDER_CONSTANT, value=(114, 114, 114))
+    return image, new_width / width, new_height / height
+
+
+def restore_result(result, shape: tuple, scale_x: float, scale_y: float):
+    """Результат для входа model_input — в координатах исходного кадра формы shape."""
+    data = result.boxes.data.clone()
+    data[:, [0, 2]] /= scale_x
+    data[:, [1, 3]] /= scale_y
+    result.orig_shape = shape[:2]
+    result.update(boxes=data)
+    return result
 
-    for box in results.boxes:
-        cls_id = int(box.cls[0])
-        cls_name = model.names[cls_id]
-        conf = float(box.conf[0])
-        xyxy = box.xyxy[0].cpu().numpy()
 
-        if cls_name not in relevant_classes:
+def predict_one(model: YOLO, image: np.ndarray, imgsz: int = IMG_SIZE, augment: bool = True):
+    """Предсказание для одного изображения (через микробатчинг, если он включён)."""
+    if isinstance(model, ModelClient):
+        return predict_remote(model, [image], imgsz, augment)[0]
+    if INFERENCE_BATCH_SIZE <= 1:
+        return predict_batch(model, [image], imgsz, augment)[0]
+    # В батч попадают кадры одной формы входа модели — иначе ultralytics дополнил бы все до квадрата
+    inputs, scale_x, scale_y = model_input(image, imgsz)
+    future = get_batcher().submit(inputs, key=(model, imgsz, augment, False, inputs.shape))
+    return restore_result(request_deadline.wait(future), image.shape, scale_x, scale_y)
+
+
+def predict_group(model: YOLO, images: list[np.ndarray], imgsz: int, augment: bool = False) -> list:
+    """Предсказания для группы изображений одного запроса (тайлы фото) одним батчем."""
+    if isinstance(model, ModelClient):
+        return predict_remote(model, images, imgsz, augment)
+    fitted = [model_input(image, imgsz) for image in images]
+    inputs = [image for image, _, _ in fitted]
+    if INFERENCE_BATCH_SIZE <= 1:
+        results = predict_batch(model, inputs, imgsz, augment)
+    else:
+        key = (model, imgsz, augment, True, tuple(image.shape for image in inputs))
+        results = request_deadline.wait(get_batcher().submit(inputs, key=key))
+    return [
+        restore_result(result, image.shape, scale_x, scale_y)
+        for result, image, (_, scale_x, scale_y) in zip(results, images, fitted, strict=True)
+    ]
+
+
+def detections_from_data(data: np.ndarray, names: dict[int, str], img_area: float) -> Detections:
+    """Детекции из массива (N, 6) [x1, y1, x2, y2, conf, cls]; отбрасывает классы вне комплекта и слишком крупные боксы."""
+    cls = class_lookup(names)[data[:, -1].astype(np.int64)]
+    detections = Detections(cls, data[:, -2].astype(np.float64), data[:, :4])
+    return detections.take((cls >= 0) & (detections.area <= img_area * MAX_BOX_AREA_RATIO))
+
+
+def detections_from_result(result, img_area: float) -> Detections:
+    """Боксы результата ultralytics одной копией на хост."""
+    return detections_from_data(result.boxes.data.cpu().numpy(), result.names, img_area)
+
+
+def tile_origins(length: int, tile: int, overlap: float) -> list[int]:
+    """Начала тайлов вдоль стороны: равномерно, с перекрытием не меньше overlap."""
+    if length <= tile:
+        return [0]
+    count = math.ceil((length - tile) / (tile * (1 - overlap))) + 1
+    return np.linspace(0, length - tile, count).round().astype(int).tolist()
+
+
+def boxes_iou(box: np.ndarray, boxes: np.ndarray) -> np.ndarray:
+    """IoU бокса [x1, y1, x2, y2] с каждым из боксов (M, 4)."""
+    inter_w = np.clip(np.minimum(box[2], boxes[:, 2]) - np.maximum(box[0], boxes[:, 0]), 0, None)
+    inter_h = np.clip(np.minimum(box[3], boxes[:, 3]) - np.maximum(box[1], boxes[:, 1]), 0, None)
+    inter = inter_w * inter_h
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    return inter / np.maximum(area + areas - inter, 1e-9)
+
+
+def nms(data: np.ndarray, iou_threshold: float) -> np.ndarray:
+    """NMS по классам для массива (N, 6) [x1, y1, x2, y2, conf, cls]; строки по убыванию confidence."""
+    data = data[np.argsort(-data[:, 4], kind='stable')]
+    boxes, cls = data[:, :4], data[:, 5]
+    suppressed = np.zeros(len(data), dtype=bool)
+    for i in range(len(data)):
+        if suppressed[i]:
             continue
-
-        obj = DetectedObject(cls_name, conf, xyxy)
-        if obj.area > img_area * MAX_BOX_AREA_RATIO:
+        rest = np.flatnonzero(~suppressed[i + 1:] & (cls[i + 1:] == cls[i])) + i + 1
+        suppressed[rest[boxes_iou(boxes[i], boxes[rest]) > iou_threshold]] = True
+    return data[~suppressed]
+
+
+def weighted_box_fusion(data: np.ndarray, iou_threshold: float, views: int) -> np.ndarray:
+    """WBF по классам: боксы одного предмета из разных видов усредняются с весами confidence.
+
+    Confidence слитого бокса — средняя по views видам (вид, не нашедший предмет, даёт 0),
+    поэтому предмет, найденный одним видом из трёх, теряет уверенность.
+    """
+    data = data[np.argsort(-data[:, 4], kind='stable')]
+    boxes, conf, cls = data[:, :4], data[:, 4], data[:, 5]
+    assigned = np.zeros(len(data), dtype=bool)
+    fused = []
+    for i in range(len(data)):
+        if assigned[i]:
             continue
-        objects.append(obj)
-
-    return objects
-
-
-def classify_bandages(bandages: list[DetectedObject]) -> list[DetectedObject]:
+        rest = np.flatnonzero(~assigned & (cls == cls[i]))
+        members = rest[boxes_iou(boxes[i], boxes[rest]) > iou_threshold]
+        assigned[members] = True
+        weights = conf[members]
+        box = (boxes[members] * weights[:, None]).sum(axis=0) / weights.sum()
+        fused.append([*box, weights.sum() / max(views, len(members)), cls[i]])
+    return np.array(fused, dtype=np.float32).reshape(-1, 6)
+
+
+def tta_views(image: np.ndarray) -> list[np.ndarray]:
+    """Виды фото для TTA одного размера: масштаб TTA_SCALES (на сером поле), отражение TTA_FLIPS."""
+    if len(TTA_SCALES) != len(TTA_FLIPS):
+        raise ValueError("TTA_SCALES и TTA_FLIPS должны задавать одинаковое число видов")
+    height, width = image.shape[:2]
+    views = []
+    for scale, flip in zip(TTA_SCALES, TTA_FLIPS, strict=True):
+        view = cv2.flip(image, 1) if flip else image
+        if scale != 1:
+            small = cv2.resize(view, (round(width * scale), round(height * scale)), interpolation=cv2.INTER_AREA)
+            view = np.full_like(image, 114)
+            view[:small.shape[0], :small.shape[1]] = small
+        views.append(view)
+    return views
+
+
+def tta_detect(model: YOLO, image: np.ndarray, imgsz: int, img_area: float) -> Detections:
+    """TTA одним батчем: все виды фото за один вызов модели, слияние в координатах фото."""
+    height, width = image.shape[:2]
+    # Виды строятся сразу в размере входа модели: меньше памяти и ресайзов
+    base = min(1.0, imgsz / max(height, width))
+    work = cv2.resize(image, None, fx=base, fy=base, interpolation=cv2.INTER_AREA) if base < 1 else image
+    work_width = work.shape[1]
+    results = predict_group(model, tta_views(work), imgsz)
+
+    parts = []
+    for scale, flip, result in zip(TTA_SCALES, TTA_FLIPS, results, strict=True):
+        data = result.boxes.data.cpu().numpy().copy()
+        data[:, :4] /= scale
+        if flip:
+            data[:, [0, 2]] = work_width - data[:, [2, 0]]
+        parts.append(data)
+
+    merged = np.concatenate(parts)
+    merged[:, :4] /= base
+    with metrics.observe_stage('tta_merge'):
+        if TTA_FUSION == 'wbf':
+            merged = weighted_box_fusion(merged, TTA_IOU, len(results))
+        else:
+            merged = nms(merged, TTA_IOU)
+    return detections_from_data(merged, results[0].names, img_area)
+
+
+def tiled_detect(model: YOLO, image: np.ndarray, img_area: float) -> Detections:
+    """Детекция по перекрывающимся тайлам и целому кадру с общим NMS в координатах исходного фото."""
+    height, width = image.shape[:2]
+    scale = min(1.0, TILE_MAX_SIDE / max(height, width))
+    work = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) if scale < 1 else image
+    work_height, work_width = work.shape[:2]
+
+    origins = [
+        (x, y)
+        for y in tile_origins(work_height, TILE_SIZE, TILE_OVERLAP)
+        for x in tile_origins(work_width, TILE_SIZE, TILE_OVERLAP)
+    ]
+    tiles = [work[y:y + TILE_SIZE, x:x + TILE_SIZE] for x, y in origins]
+    # Целый кадр — для крупных предметов, которые не помещаются в тайл. Он уменьшается
+    # и кладётся на серое поле размером с тайл: в одном вызове модели — одна форма входа
+    tile_height, tile_width = tiles[0].shape[:2]
+    overview_scale = min(tile_height / work_height, tile_width / work_width)
+    overview = np.full_like(tiles[0], 114)
+    small = cv2.resize(
+        work,
+        (round(work_width * overview_scale), round(work_height * overview_scale)),
+        interpolation=cv2.INTER_AREA,
+    )
+    overview[:small.shape[0], :small.shape[1]] = small
+    results = predict_group(model, [overview, *tiles], TILE_SIZE)
+
+    margin = TILE_EDGE_MARGIN * TILE_SIZE
+    whole = results[0].boxes.data.cpu().numpy().copy()
+    whole[:, :4] /= overview_scale
+    parts = [whole]
+    for (x, y), tile, result in zip(origins, tiles, results[1:], strict=True):
+        data = result.boxes.data.cpu().numpy()
+        tile_height, tile_width = tile.shape[:2]
+        # Обрезанные внутренней границей тайла боксы отбрасываем (у границы фото — оставляем)
+        cut = (
+            ((data[:, 0] <= margin) & (x > 0))
+            | ((data[:, 1] <= margin) & (y > 0))
+            | ((data[:, 2] >= tile_width - margin) & (x + tile_width < work_width))
+            | ((data[:, 3] >= tile_height - margin) & (y + tile_height < work_height))
+        )
+        data = data[~cut].copy()
+        data[:, [0, 2]] += x
+        data[:, [1, 3]] += y
+        parts.append(data)
+
+    merged = np.concatenate(parts)
+    merged[:, :4] /= scale
+    with metrics.observe_stage('tile_merge'):
+        merged = nms(merged, TILE_NMS_IOU)
+    # Фильтр по площади — уже в координатах целого изображения
+    return detections_from_data(merged, results[0].names, img_area)
+
+
+def raw_detect(
+    model: YOLO,
+    image: np.ndarray,
+    img_area: float,
+    imgsz: int = IMG_SIZE,
+    augment: bool = True,
+    tiled: bool = False,
+    region: tuple[int, int, int, int] | None = None,
+) -> Detections:
+    """Сырая детекция объектов с базовой фильтрацией.
+
+    augment — TTA (одним батчем при TTA_BATCHED, иначе augment=True ultralytics);
+    tiled — по тайлам вместо imgsz/augment; region — (x1, y1, x2, y2): детекция только
+    внутри области, боксы возвращаются в координатах всего изображения.
+    """
+    if region is not None:
+        x1, y1, x2, y2 = region
+        return raw_detect(model, image[y1:y2, x1:x2], img_area, imgsz, augment, tiled).shifted(x1, y1)
+    if tiled:
+        return tiled_detect(model, image, img_area)
+    if augment and TTA_BATCHED:
+        return tta_detect(model, image, imgsz, img_area)
+    return detections_from_result(predict_one(model, image, imgsz, augment), img_area)
+
+
+def kit_region(detections: Detections, width: int, height: int) -> tuple[int, int, int, int] | None:
+    """Область комплекта по дешёвому проходу: объединение уверенных боксов с полями.
+
+    None — кадрировать нечего (нет уверенных боксов) или незачем (область почти во весь кадр).
+    """
+    boxes = detections.boxes[detections.conf >= ROI_MIN_CONF]
+    if not len(boxes):
+        return None
+
+    x1, y1 = boxes[:, :2].min(axis=0)
+    x2, y2 = boxes[:, 2:].max(axis=0)
+    margin_x = max((x2 - x1) * (1 + 2 * ROI_MARGIN), width * ROI_MIN_SIDE) / 2
+    margin_y = max((y2 - y1) * (1 + 2 * ROI_MARGIN), height * ROI_MIN_SIDE) / 2
+    center_x, center_y = (x1 + x2) / 2, (y1 + y2) / 2
+    region = (
+        max(0, math.floor(center_x - margin_x)),
+        max(0, math.floor(center_y - margin_y)),
+        min(width, math.ceil(center_x + margin_x)),
+        min(height, math.ceil(center_y + margin_y)),
+    )
+    if (region[2] - region[0]) * (region[3] - region[1]) > ROI_MAX_AREA_RATIO * width * height:
+        return None
+    return region
+
+
+def warm_up_model() -> None:
+    """Прогревочный инференс на IMG_SIZE: первый реальный запрос не платит за инициализацию."""
+    model = get_model()
+    # Клиент сервера модели готов, как только сервер ответил: модель прогревает сервер.
+    # Реестр мог переключиться после загрузки модели в мастере; новая версия прогревается при замене.
+    if not isinstance(model, ModelClient) and not (MODEL_REGISTRY_DIR and swap_model()):
+        # Модель могла смениться, пока swap_model ждал замену из опроса реестра
+        model, version = get_active_model()
+        warm_up(model)
+        metrics.MODEL_VERSION.labels(version).set(1)
+    MODEL_READY.set()
+
+
+def warm_up(model: YOLO) -> None:
+    """WARMUP_RUNS прогонов всех проходов, которые выполняет запрос."""
+    dummy = np.full((IMG_SIZE, IMG_SIZE, 3), 114, dtype=np.uint8)
+    for _ in range(WARMUP_RUNS):
+        if CASCADE_ENABLED:
+            raw_detect(model, dummy, dummy.shape[0] * dummy.shape[1], imgsz=CASCADE_FAST_IMG_SIZE, augment=False)
+        elif ROI_ENABLED:
+            raw_detect(model, dummy, dummy.shape[0] * dummy.shape[1], imgsz=ROI_IMG_SIZE, augment=False)
+        raw_detect(model, dummy, dummy.shape[0] * dummy.shape[1], tiled=TILING_ENABLED)
+        if REQUEST_BUDGET > 0:
+            raw_detect(model, dummy, dummy.shape[0] * dummy.shape[1], imgsz=DEGRADED_IMG_SIZE, augment=False)
+
+
+def largest_area_gap(areas: np.ndarray) -> tuple[float, int]:
+    """Наибольшее отношение площадей соседних бинтов (площади отсортированы по убыванию)."""
+    if len(areas) < 2:
+        return 0.0, -1
+    ratios = areas[:-1] / np.where(areas[1:] > 0, areas[1:], 1e-6)
+    split_idx = int(np.argmax(ratios))
+    if ratios[split_idx] > 0:
+        return float(ratios[split_idx]), split_idx
+    return 0.0, -1
+
+
+def by_conf_desc(conf: np.ndarray) -> np.ndarray:
+    """Порядок по убыванию confidence; при равенстве сохраняется исходный порядок."""
+    return np.argsort(-conf, kind='stable')
+
+
+def classify_bandages(bandages: Detections) -> Detections:
     """Классифицирует бинты как большие/малые по площади и confidence."""
-    if not bandages:
-        return []
-
-    bandages = [b for b in bandages if b.conf >= HIGH_CONF]
-    if not bandages:
-        return []
-
-    bandages.sort(key=lambda x: x.area, reverse=True)
-    areas = [b.area for b in bandages]
-    max_gap = 0.0
-    split_idx = -1
-    gap_confirmed = False
+    bandages = bandages.take(bandages.conf >= HIGH_CONF)
+    if not len(bandages):
+        return bandages
 
-    if len(bandages) > 1:
-        for i in range(len(areas) - 1):
-            denom = areas[i + 1] if areas[i + 1] > 0 else 1e-6
-            ratio = areas[i] / denom
-            if ratio > max_gap:
-                max_gap = ratio
-                split_idx = i
+    bandages = bandages.take(np.argsort(-bandages.area, kind='stable'))
+    count = len(bandages)
+    max_gap, split_idx = largest_area_gap(bandages.area)
 
     if max_gap >= BANDAGE_GAP_THRESHOLD:
-        gap_confirmed = True
-        for i, bandage in enumerate(bandages):
-            bandage.cls_name = 'Large bandage' if i <= split_idx else 'small bandage'
+        # Граница по разрыву площадей, затем сдвиг, чтобы в каждой группе было до трёх бинтов
+        split = split_idx + 1
+        while split > 3 and count - split < 3:
+            split -= 1
+        while count - split > 3 and split < 3:
+            split += 1
+        cls = np.where(np.arange(count) < split, LARGE_BANDAGE, SMALL_BANDAGE)
     else:
-        votes_large = sum(1 for b in bandages if 'Large' in b.cls_name)
-        votes_small = len(bandages) - votes_large
+        is_large = bandages.cls == LARGE_BANDAGE
+        votes_large = int(np.count_nonzero(is_large))
+        votes_small = count - votes_large
 
         if votes_large > votes_small:
-            winner = 'Large bandage'
+            winner = LARGE_BANDAGE
         elif votes_small > votes_large:
-            winner = 'small bandage'
+            winner = SMALL_BANDAGE
         else:
-            avg_large = np.mean([b.area for b in bandages if 'Large' in b.cls_name]) if votes_large > 0 else 0
-            avg_small = np.mean([b.area for b in bandages if 'small' in b.cls_name]) if votes_small > 0 else 0
-            winner = 'Large bandage' if avg_large >= avg_small else 'small bandage'
+            avg_large = bandages.area[is_large].mean() if votes_large > 0 else 0
+            avg_small = bandages.area[~is_large].mean() if votes_small > 0 else 0
+            winner = LARGE_BANDAGE if avg_large >= avg_small else SMALL_BANDAGE
+        cls = np.full(count, winner)
 
-        for bandage in bandages:
-            bandage.cls_name = winner
+    bandages = Detections(cls, bandages.conf, bandages.boxes, bandages.area)
+    selected = []
+    for label in (LARGE_BANDAGE, SMALL_BANDAGE):
+        group = np.flatnonzero(cls == label)
+        selected.append(group[by_conf_desc(bandages.conf[group])][:3])
+    return bandages.take(np.concatenate(selected))
 
-    large_group = [b for b in bandages if 'Large' in b.cls_name]
-    small_group = [b for b in bandages if 'small' in b.cls_name]
 
-    if gap_confirmed:
-        large_group.sort(key=lambda x: x.area, reverse=True)
-        small_group.sort(key=lambda x: x.area, reverse=True)
+def two_tier_filter(objects: Detections) -> Detections:
+    """Фильтр в два уровня: сначала high confidence, затем добивка low confidence.
 
-        while len(large_group) > 3 and len(small_group) < 3:
-            item = large_group.pop()
-            item.cls_name = 'small bandage'
-            small_group.insert(0, item)
+    Внутри класса боксы упорядочены по убыванию confidence, поэтому оба уровня вместе —
+    это первые REQUIRED_ITEMS[класс] боксов класса.
+    """
+    objects = objects.take(~np.isin(objects.cls, BANDAGE_CLASSES))
+    order = np.lexsort((-objects.conf, objects.cls))
+    cls = objects.cls[order]
+    rank = np.arange(len(cls)) - np.searchsorted(cls, cls)
+    return objects.take(order[rank < REQUIRED_LIMITS[cls]])
 
-        while len(small_group) > 3 and len(large_group) < 3:
-            item = small_group.pop(0)
-            item.cls_name = 'Large bandage'
-            large_group.append(item)
 
-    large_group.sort(key=lambda x: x.conf, reverse=True)
-    small_group.sort(key=lambda x: x.conf, reverse=True)
-    return large_group[:3] + small_group[:3]
-
-
-def two_tier_filter(objects: list[DetectedObject]) -> list[DetectedObject]:
-    """Фильтр в два уровня: сначала high confidence, затем добивка low confidence."""
-    grouped: dict[str, list[DetectedObject]] = {}
-    for obj in objects:
-        grouped.setdefault(obj.cls_name, []).append(obj)
-
-    result: list[DetectedObject] = []
-    for cls_name, limit in REQUIRED_ITEMS.items():
-        if 'bandage' in cls_name.lower():
-            continue
-
-        candidates = grouped.get(cls_name, [])
-        candidates.sort(key=lambda x: x.conf, reverse=True)
-        high = [obj for obj in candidates if obj.conf >= HIGH_CONF][:limit]
-        selected = list(high)
-
-        remaining = limit - len(selected)
-        if remaining > 0:
-            low = [obj for obj in candidates if obj.conf < HIGH_CONF][:remaining]
-            selected.extend(low)
-
-        result.extend(selected)
-
-    return result
-
-
-def filter_detections(raw_objects: list[DetectedObject]) -> list[DetectedObject]:
+def filter_detections(raw_objects: Detections) -> list[DetectedObject]:
     """Финальная фильтрация детекций, включая отдельную логику для бинтов."""
-    bandages = [obj for obj in raw_objects if 'bandage' in obj.cls_name.lower()]
-    others = [obj for obj in raw_objects if 'bandage' not in obj.cls_name.lower()]
-    filtered_bandages = classify_bandages(bandages)
-    filtered_others = two_tier_filter(others)
-    return filtered_bandages + filtered_others
+    is_bandage = np.isin(raw_objects.cls, BANDAGE_CLASSES)
+    filtered_bandages = classify_bandages(raw_objects.take(is_bandage))
+    filtered_others = two_tier_filter(raw_objects.take(~is_bandage))
+    return filtered_bandages.to_objects() + filtered_others.to_objects()
+
+
+def bandages_ambiguous(raw_objects: Detections) -> bool:
+    """Неоднозначно ли разделение бинтов на большие/малые (до filter_detections)."""
+    bandages = raw_objects.take(np.isin(raw_objects.cls, BANDAGE_CLASSES) & (raw_objects.conf >= HIGH_CONF))
+    if len(bandages) < 2:
+        return False
+
+    max_gap, _ = largest_area_gap(np.sort(bandages.area)[::-1])
+    low = BANDAGE_GAP_THRESHOLD / CASCADE_BANDAGE_GAP_MARGIN
+    high = BANDAGE_GAP_THRESHOLD * CASCADE_BANDAGE_GAP_MARGIN
+    if low <= max_gap < high:
+        return True
+
+    votes_large = int(np.count_nonzero(bandages.cls == LARGE_BANDAGE))
+    return max_gap < BANDAGE_GAP_THRESHOLD and votes_large * 2 == len(bandages)
+
+
+def detect_kit(model: YOLO, image: np.ndarray, quality: str = 'full') -> tuple[list[DetectedObject], str]:
+    """Детекция и фильтрация; возвращает итоговые объекты и проход, принявший решение.
+
+    Проход — 'fast'/'full'/'tiled'; при сниженном уровне качества quality — один
+    проход с его настройками ('degraded').
+    """
+    img_area = image.shape[0] * image.shape[1]
+
+    if quality != 'full':
+        imgsz, augment, _ = QUALITY_LEVELS[quality]
+        raw_objects = raw_detect(model, image, img_area, imgsz=imgsz, augment=augment)
+        with metrics.observe_stage('filter'):
+            return filter_detections(raw_objects), 'degraded'
+
+    if CASCADE_ENABLED:
+        raw_objects = raw_detect(model, image, img_area, imgsz=CASCADE_FAST_IMG_SIZE, augment=False)
+        ambiguous = bandages_ambiguous(raw_objects)
+        with metrics.observe_stage('filter'):
+            filtered_objects = filter_detections(raw_objects)
+        is_complete, _, _ = build_result(Counter(obj.cls_name for obj in filtered_objects))
+        low_tier = any(obj.conf < HIGH_CONF for obj in filtered_objects)
+        if is_complete and not ambiguous and not low_tier:
+            return filtered_objects, 'fast'
+
+    region = None
+    if ROI_ENABLED:
+        with metrics.observe_stage('roi'):
+            # Быстрый проход каскада уже дал боксы — отдельный дешёвый проход не нужен
+            if not CASCADE_ENABLED:
+                raw_objects = raw_detect(model, image, img_area, imgsz=ROI_IMG_SIZE, augment=False)
+            region = kit_region(raw_objects, image.shape[1], image.shape[0])
+        crop_area = (region[2] - region[0]) * (region[3] - region[1]) if region else img_area
+        metrics.ROI_AREA_RATIO.observe(crop_area / img_area)
+
+    raw_objects = raw_detect(model, image, img_area, tiled=TILING_ENABLED, region=region)
+    with metrics.observe_stage('filter'):
+        return filter_detections(raw_objects), 'tiled' if TILING_ENABLED else 'full'
+
+
+def choose_quality(deadline: Deadline | None) -> str:
+    """Самый качественный уровень, который по оценке длительности укладывается в остаток бюджета.
+
+    Уровень без свежей оценки считается успевающим. Если не успевает даже самый
+    дешёвый — запрос отменяется сразу, не занимая модель.
+    """
+    if deadline is None:
+        return 'full'
+    remaining = deadline.remaining()
+    for level in QUALITY_LEVELS:
+        estimate = QUALITY_COSTS.estimate(level)
+        if estimate is None or estimate * DEADLINE_SAFETY <= remaining:
+            return level
+    if estimate > remaining:
+        raise DeadlineExceeded(f"Осталось {max(remaining, 0):.1f} с бюджета, проверка займёт около {estimate:.1f} с")
+    return level
 
 
 def draw_boxes(image: np.ndarray, objects: list[DetectedObject]) -> np.ndarray:
@@ -259,6 +1312,19 @@ def encode_image_to_base64(image: np.ndarray) -> str:
     return base64.b64encode(buffer).decode('utf-8')
 
 
+def serialize_boxes(objects: list[DetectedObject], width: int, height: int) -> list[dict]:
+    """Боксы в нормированных координатах [x1, y1, x2, y2] (доли ширины и высоты изображения)."""
+    scale = np.array([width, height, width, height], dtype=np.float64)
+    return [
+        {
+            'class': obj.cls_name,
+            'conf': round(float(obj.conf), 4),
+            'box': [round(float(v), 5) for v in np.asarray(obj.box, dtype=np.float64) / scale],
+        }
+        for obj in objects
+    ]
+
+
 def build_result(found: Counter) -> tuple[bool, str, list[str]]:
     """Формирует итоговый текст по комплектности."""
     missing = []
@@ -277,55 +1343,575 @@ def build_result(found: Counter) -> tuple[bool, str, list[str]]:
     return is_complete, result_text, missing
 
 
+def client_id() -> str:
+    """Клиент для лимитов: известный API-ключ или IP (за TRUSTED_PROXIES прокси — из X-Forwarded-For)."""
+    api_key = request.headers.get('X-API-Key', '')
+    if api_key in RATE_LIMIT_API_KEYS:
+        return 'key:' + hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:16]
+    address = request.remote_addr or ''
+    if TRUSTED_PROXIES > 0:
+        forwarded = [part.strip() for part in request.headers.get('X-Forwarded-For', '').split(',') if part.strip()]
+        if len(forwarded) >= TRUSTED_PROXIES:
+            address = forwarded[-TRUSTED_PROXIES]
+    return 'ip:' + address
+
+
+def admit(cost: float = 1.0) -> str | None:
+    """Билет допуска запроса к инференсу (None — без учёта); лимит превышен — Rejected."""
+    if not ADMISSION_ENABLED:
+        return None
+    try:
+        ticket = get_admission().acquire(client_id(), os.getpid(), cost)
+    except Rejected as e:
+        metrics.SHED_REQUESTS.labels(e.reason).inc()
+        raise
+    metrics.ADMITTED_INFLIGHT.inc()
+    return ticket
+
+
+def charge(client: str | None, cost: float = 1.0) -> None:
+    """Токен файла /bulk из отдельной корзины; client — из admission_client(); лимит превышен — Rejected."""
+    if client is None:
+        return
+    try:
+        get_bulk_admission().charge(client, cost)
+    except Rejected as e:
+        metrics.SHED_REQUESTS.labels(e.reason).inc()
+        raise
+
+
+def admission_client() -> str | None:
+    """Клиент для charge(); берётся в контексте запроса, пока он ещё доступен (до стриминга ответа)."""
+    return client_id() if ADMISSION_ENABLED else None
+
+
+def release(ticket: str | None) -> None:
+    """Возвращает билет допуска, когда работа по запросу закончена."""
+    if ADMISSION_ENABLED:
+        get_admission().release(ticket)
+        metrics.ADMITTED_INFLIGHT.dec()
+
+
+@contextmanager
+def admitted(cost: float = 1.0) -> Iterator[None]:
+    """Блок, выполняемый по билету допуска."""
+    ticket = admit(cost)
+    try:
+        yield
+    finally:
+        release(ticket)
+
+
+def rejected_response(e: Rejected):
+    response = jsonify({'error': f'{e}, повторите попытку позже', 'reason': e.reason})
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response, 429
+
+
 @app.route('/')
 def index():
     """Главная страница."""
     return render_template('index.html', app_title=APP_TITLE)
 
 
+@app.route('/upload-config')
+def upload_config():
+    """Как клиенту подготовить фото: до какой длинной стороны уменьшить и в каком формате отправить."""
+    return jsonify({
+        'max_side': UPLOAD_MAX_SIDE,
+        'format': f'image/{UPLOAD_FORMAT}',
+        'quality': UPLOAD_QUALITY,
+        'img_size': IMG_SIZE,
+    })
+
+
+@app.route('/ready')
+def ready():
+    """Readiness-проба: 200 только после загрузки и прогрева модели."""
+    if not MODEL_READY.is_set():
+        return jsonify({'ready': False}), 503
+    return jsonify({'ready': True})
+
+
+@app.route('/cache/stats')
+def cache_stats():
+    """Счётчики попаданий и промахов кэша результатов (общие для всех воркеров)."""
+    if not RESULT_CACHE_ENABLED:
+        return jsonify({'enabled': False})
+    return jsonify({'enabled': True, **get_result_cache().stats()})
+
+
+def inspect_image(image_bytes: bytes, render: str) -> str:
+    """Полная проверка фото; возвращает JSON-ответ (с учётом кэша результатов)."""
+    try:
+        return _inspect_image(image_bytes, render)
+    except ImageRejected as e:
+        metrics.REQUESTS.labels('rejected').inc()
+        metrics.REJECTED_UPLOADS.labels(e.reason).inc()
+        raise
+    except DeadlineExceeded:
+        metrics.REQUESTS.labels('timeout').inc()
+        raise
+    except Exception:
+        metrics.REQUESTS.labels('error').inc()
+        raise
+
+
+def run_job(image_bytes: bytes, render: str, ticket: str | None) -> str:
+    """Задача /jobs: билет допуска держится, пока задача ждёт в очереди и выполняется."""
+    try:
+        return inspect_image(image_bytes, render)
+    finally:
+        release(ticket)
+
+
+def _inspect_image(image_bytes: bytes, render: str) -> str:
+    with metrics.observe_stage('precheck'):
+        size = sniff_image(image_bytes)
+
+    # Модель и её версия берутся один раз: реестр может подменить модель во время запроса
+    model, model_version = get_active_model()
+
+    # Повторно присланное фото отдаём из кэша без инференса
+    cache_key = result_cache_key(image_bytes, render, model_version) if RESULT_CACHE_ENABLED else None
+    if cache_key is not None:
+        cached = get_result_cache().get(cache_key)
+        if cached is not None:
+            return cached
+
+    if not SINGLE_FLIGHT_ENABLED:
+        return _inspect_uncached(image_bytes, size, render, model, model_version, cache_key)
+
+    # Повтор фото, которое ещё проверяется (ретрай с нестабильной сети), ждёт первую проверку;
+    # результат проверки в другом воркере приходит через кэш
+    body, shared = get_single_flight().run(
+        cache_key or result_cache_key(image_bytes, render, model_version),
+        lambda: _inspect_uncached(image_bytes, size, render, model, model_version, cache_key),
+        lookup=lambda: get_result_cache().get(cache_key) if cache_key is not None else None,
+    )
+    if shared is not None:
+        metrics.COALESCED_REQUESTS.labels(shared).inc()
+    return body
+
+
+def _inspect_uncached(
+    image_bytes: bytes,
+    size: tuple[int, int],
+    render: str,
+    model: YOLO | ModelClient,
+    model_version: str,
+    cache_key: str | None,
+) -> str:
+    """Проверка фото без обращения к кэшу; результат кладётся в кэш по cache_key."""
+    request_deadline.check('decode')
+    with metrics.observe_stage('decode'):
+        bgr_img = decode_image_to_bgr(image_bytes, size)
+    with metrics.observe_stage('precheck'):
+        issue = quality_issue(bgr_img)
+    if issue is not None:
+        raise issue
+
+    # Чем меньше осталось бюджета задержки, тем дешевле проверка
+    quality = choose_quality(request_deadline.current())
+    started = time.perf_counter()
+    # Детекция и фильтрация по встроенной логике (с каскадом, если он включён)
+    try:
+        filtered_objects, inference_tier = detect_kit(model, bgr_img, quality)
+    except DeadlineExceeded:
+        # Уровень занял не меньше этого времени: иначе под перегрузкой, когда ни один
+        # запрос не доходит до конца, оценка не обновится и уровень не снизится
+        QUALITY_COSTS.observe(quality, time.perf_counter() - started)
+        raise
+    MODEL_READY.set()
+    # Сервер модели мог переключить версию между запросом к кэшу и инференсом
+    served_version = model.version if isinstance(model, ModelClient) else model_version
+    found = Counter(obj.cls_name for obj in filtered_objects)
+    is_complete, result_text, missing = build_result(found)
+    metrics.REQUESTS.labels('complete' if is_complete else 'incomplete').inc()
+    metrics.INFERENCE_TIERS.labels(inference_tier).inc()
+
+    height, width = bgr_img.shape[:2]
+    payload = {
+        'success': True,
+        'is_complete': is_complete,
+        'result_text': result_text,
+        'missing': missing,
+        'image_size': [width, height],
+        'boxes': serialize_boxes(filtered_objects, width, height),
+        'inference_tier': inference_tier,
+        'model_version': served_version,
+        'quality': quality,
+    }
+
+    # Рисуем боксы на изображении (без подписей) и кодируем в base64;
+    # в режиме boxes и на дешёвом уровне качества рисует клиент
+    if render == 'image' and QUALITY_LEVELS[quality][2]:
+        with metrics.observe_stage('draw_boxes'):
+            annotated_img = draw_boxes(bgr_img, filtered_objects)
+        with metrics.observe_stage('encode_image'):
+            payload['annotated_image'] = encode_image_to_base64(annotated_img)
+
+    body = app.json.dumps(payload)
+    QUALITY_COSTS.observe(quality, time.perf_counter() - started)
+    if quality != 'full':
+        metrics.DEGRADED_REQUESTS.labels(quality).inc()
+    # Сниженный по нагрузке результат не кэшируем: повтор фото получит полную проверку
+    elif cache_key is not None and served_version == model_version:
+        get_result_cache().put(cache_key, body)
+    return body
+
+
+def inspect_frame(state: dict, image_bytes: bytes) -> dict:
+    """Кадр живой проверки: обновляет состояние сессии state и возвращает ответ."""
+    with metrics.observe_stage('precheck'):
+        size = sniff_image(image_bytes)
+    with metrics.observe_stage('decode'):
+        frame = decode_image_to_bgr(image_bytes, size)
+    height, width = frame.shape[:2]
+    thumbnail = frame_thumbnail(frame)
+    tracker = KitTracker(state.get('tracker'), LIVE_TRACK_IOU, LIVE_MIN_HITS, LIVE_TRACK_GROUPS)
+    previous = state.get('thumbnail')
+    state['frame'] += 1
+
+    # Смазанный или тёмный кадр пропускается: следующий кадр придёт через доли секунды
+    with metrics.observe_stage('precheck'):
+        issue = quality_issue(frame)
+    # Камера почти не сдвинулась и кадр почти не изменился — инференс ничего не добавит,
+    # если только не ждут подтверждения свежие треки: неподвижной камере их иначе не набрать
+    shift = frame_shift(previous, thumbnail) if previous is not None else (0.0, 0.0)
+    skipped = issue is not None or (
+        previous is not None
+        and not tracker.pending(state['frame'])
+        and max(abs(shift[0]), abs(shift[1])) < LIVE_SKIP_SHIFT
+        and frame_change(previous, thumbnail) < LIVE_SKIP_DIFF
+    )
+    if not skipped:
+        tracker.move(*shift)
+        model, _ = get_active_model()
+        raw_objects = raw_detect(model, frame, height * width, imgsz=LIVE_IMG_SIZE, augment=False)
+        MODEL_READY.set()
+        with metrics.observe_stage('filter'):
+            # В треки попадают только уверенные детекции: кадров много, ложные не нужны
+            objects = [obj for obj in filter_detections(raw_objects) if obj.conf >= HIGH_CONF]
+        boxes = serialize_boxes(objects, width, height)
+        track_ids = tracker.update(((box['class'], box['box']) for box in boxes), state['frame'])
+        for box, track_id in zip(boxes, track_ids, strict=True):
+            box['track'] = track_id
+        state.update(thumbnail=thumbnail, tracker=tracker.state(), boxes=boxes)
+    metrics.LIVE_FRAMES.labels('rejected' if issue is not None else 'skipped' if skipped else 'inferred').inc()
+
+    found = tracker.counts()
+    is_complete, result_text, missing = build_result(found)
+    return {
+        'success': True,
+        'frame': state['frame'],
+        'skipped': skipped,
+        'notice': str(issue) if issue is not None else None,
+        'is_complete': is_complete,
+        'result_text': result_text,
+        'missing': missing,
+        'found': dict(found),
+        'image_size': [width, height],
+        'boxes': state.get('boxes', []),
+    }
+
+
+def collect_cache_metrics():
+    """Счётчики кэша результатов (уже общие для воркеров — читаются из его базы)."""
+    if not RESULT_CACHE_ENABLED:
+        return []
+    stats = get_result_cache().stats()
+    families = [
+        CounterMetricFamily(f'medkit_result_cache_{name}', f'Кэш результатов: {name}', value=stats[name])
+        for name in ('hits', 'misses', 'evictions')
+    ]
+    families.append(GaugeMetricFamily('medkit_result_cache_entries', 'Записей в кэше', value=stats['entries']))
+    families.append(GaugeMetricFamily('medkit_result_cache_bytes', 'Размер кэша, байт', value=stats['bytes']))
+    return families
+
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Метрики в формате Prometheus (агрегированы по всем воркерам)."""
+    output, content_type = metrics.render_latest([metrics.CallbackCollector(collect_cache_metrics)])
+    return app.response_class(output, content_type=content_type)
+
+
+def request_deadline_from_headers() -> Deadline | None:
+    """Дедлайн запроса по REQUEST_BUDGET: от момента приёма прокси (X-Request-Start) или от текущего."""
+    if REQUEST_BUDGET <= 0:
+        return None
+    started = request_deadline.parse_request_start(request.headers.get('X-Request-Start'))
+    return Deadline.after(REQUEST_BUDGET, started)
+
+
 @app.route('/process', methods=['POST'])
 def process():
     """Обработка загруженного изображения."""
     try:
-        if 'image' not in request.files:
-            return jsonify({'error': 'Файл не найден'}), 400
+        # Допуск — до чтения тела: лишний запрос отсекается как можно дешевле
+        with request_deadline.scope(request_deadline_from_headers()), admitted():
+            image_bytes, render = read_upload()
+            return app.response_class(inspect_image(image_bytes, render), mimetype='application/json')
 
-        file = request.files['image']
+    except Rejected as e:
+        return rejected_response(e)
 
-        if file.filename == '':
-            return jsonify({'error': 'Файл не выбран'}), 400
+    except ImageRejected as e:
+        return jsonify({'error': str(e), 'reason': e.reason}), 422
 
-        if not allowed_file(file.filename):
-            return jsonify({'error': 'Недопустимый формат файла'}), 400
+    except DeadlineExceeded as e:
+        response = jsonify({'error': f'Сервер перегружен, повторите попытку позже ({e})'})
+        response.headers['Retry-After'] = str(DEADLINE_RETRY_AFTER)
+        return response, 503
 
-        # Читаем и декодируем изображение
-        image_bytes = file.read()
-        bgr_img = decode_image_to_bgr(image_bytes)
-        img_area = bgr_img.shape[0] * bgr_img.shape[1]
-
-        # Детекция и фильтрация по встроенной логике
-        model = get_model()
-        raw_objects = raw_detect(model, bgr_img, img_area)
-        filtered_objects = filter_detections(raw_objects)
-        found = Counter(obj.cls_name for obj in filtered_objects)
-        is_complete, result_text, missing = build_result(found)
-
-        # Рисуем боксы на изображении (без подписей) и кодируем в base64
-        annotated_img = draw_boxes(bgr_img, filtered_objects)
-        annotated_b64 = encode_image_to_base64(annotated_img)
-
-        return jsonify({
-            'success': True,
-            'is_complete': is_complete,
-            'result_text': result_text,
-            'missing': missing,
-            'annotated_image': annotated_b64,
-        })
+    except UploadError as e:
+        return jsonify({'error': str(e)}), 400
 
     except Exception as e:
         return jsonify({'error': f'Ошибка обработки: {str(e)}'}), 500
 
 
+def iter_bulk_images(uploads: list[tuple[str, io.IOBase]]) -> Iterator[tuple[str, bytes | None, str | None]]:
+    """Изображения bulk-запроса по одному: (имя, байты или None, ошибка или None)."""
+    for filename, stream in uploads:
+        with stream:
+            yield from _iter_upload(filename, stream)
+
+
+def _iter_upload(filename: str, stream: io.IOBase) -> Iterator[tuple[str, bytes | None, str | None]]:
+    if filename.lower().endswith('.zip'):
+        try:
+            archive = zipfile.ZipFile(stream)
+        except zipfile.BadZipFile:
+            yield filename, None, 'Повреждённый zip-архив'
+            return
+        with archive:
+            for info in archive.infolist():
+                if info.is_dir():
+                    continue
+                if not allowed_file(info.filename):
+                    yield info.filename, None, 'Недопустимый формат файла'
+                elif info.file_size > app.config['MAX_CONTENT_LENGTH']:
+                    yield info.filename, None, 'Файл слишком большой'
+                else:
+                    try:
+                        data = archive.read(info)
+                    except (zipfile.BadZipFile, RuntimeError, NotImplementedError, zlib.error):
+                        # Битый CRC, шифрование, неподдерживаемое сжатие — ошибка одного файла, не всего потока
+                        yield info.filename, None, 'Не удалось извлечь файл из архива'
+                        continue
+                    yield info.filename, data, None
+    elif not allowed_file(filename):
+        yield filename, None, 'Недопустимый формат файла'
+    else:
+        yield filename, stream.read(), None
+
+
+def bulk_line(
+    index: int, filename: str, body: str | None = None, error: str | None = None, reason: str | None = None
+) -> str:
+    """Строка NDJSON с результатом (ответ /process) или ошибкой (и её причиной) для одного файла."""
+    line = {'index': index, 'filename': filename}
+    if error is not None:
+        line['error'] = error
+        if reason is not None:
+            line['reason'] = reason
+    else:
+        line['result'] = json.loads(body)
+    return app.json.dumps(line) + '\n'
+
+
+def stream_bulk(
+    uploads: list[tuple[str, io.IOBase]], render: str, ticket: str | None = None, client: str | None = None
+) -> Iterator[str]:
+    """Проверяет файлы параллельно и отдаёт строки NDJSON по мере готовности; затем возвращает билет допуска.
+
+    Каждый файл стоит клиенту client токен; файл сверх лимита получает строку с ошибкой reason='rate'.
+    """
+    summary = Counter()
+    pending = {}
+    pool = ThreadPoolExecutor(max_workers=max(1, BULK_CONCURRENCY), thread_name_prefix='bulk')
+
+    def finished(futures) -> Iterator[str]:
+        for future in futures:
+            index, filename = pending.pop(future)
+            try:
+                body = future.result()
+            except ImageRejected as e:
+                summary['errors'] += 1
+                yield bulk_line(index, filename, error=str(e), reason=e.reason)
+                continue
+            except Exception as e:
+                summary['errors'] += 1
+                yield bulk_line(index, filename, error=f'Ошибка обработки: {str(e)}')
+                continue
+            summary['complete' if json.loads(body)['is_complete'] else 'incomplete'] += 1
+            yield bulk_line(index, filename, body)
+
+    try:
+        for index, (filename, image_bytes, error) in enumerate(iter_bulk_images(uploads)):
+            if error is not None:
+                summary['errors'] += 1
+                yield bulk_line(index, filename, error=error)
+                continue
+            try:
+                charge(client)
+            except Rejected as e:
+                summary['errors'] += 1
+                yield bulk_line(index, filename, error=f'{e}, повторите попытку позже', reason=e.reason)
+                continue
+
+            pending[pool.submit(inspect_image, image_bytes, render)] = (index, filename)
+            # Держим в работе ограниченное окно файлов, готовые отдаём сразу
+            if len(pending) >= 2 * max(1, BULK_CONCURRENCY):
+                wait(pending, return_when=FIRST_COMPLETED)
+            yield from finished([future for future in list(pending) if future.done()])
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            yield from finished(done)
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+        release(ticket)
+
+    total = summary['complete'] + summary['incomplete'] + summary['errors']
+    yield app.json.dumps({'summary': {'total': total, **summary}}) + '\n'
+
+
+@app.route('/bulk', methods=['POST'])
+def bulk():
+    """Массовая проверка: поля images (несколько фото и/или zip-архивы), ответ — NDJSON."""
+    request.max_content_length = BULK_MAX_CONTENT_MB * 1024 * 1024
+    request.max_form_parts = BULK_MAX_FILES + 10
+
+    render = request.args.get('render', 'boxes')
+    if render not in RENDER_MODES:
+        return jsonify({'error': 'Недопустимый режим ответа'}), 400
+
+    try:
+        # Один билет на весь запрос (параллелизм bulk и так ограничен BULK_CONCURRENCY),
+        # токены списываются за каждый файл по мере проверки
+        ticket = admit(cost=0.0)
+    except Rejected as e:
+        return rejected_response(e)
+
+    files = [file for file in request.files.getlist('images') if file.filename]
+    if not files:
+        release(ticket)
+        return jsonify({'error': 'Файлы не найдены'}), 400
+
+    # Файлы запроса закрываются вместе с его контекстом, а ответ стримится
+    # дольше — забираем потоки загруженных файлов себе
+    uploads = []
+    for file in files:
+        uploads.append((file.filename, file.stream))
+        file.stream = io.BytesIO()
+
+    response = stream_bulk(uploads, render, ticket, admission_client())
+    return app.response_class(response, mimetype='application/x-ndjson')
+
+
+@app.route('/jobs', methods=['POST'])
+def create_job():
+    """Ставит фото в очередь на проверку; результат — через GET /jobs/<id>."""
+    try:
+        ticket = admit()
+    except Rejected as e:
+        return rejected_response(e)
+
+    try:
+        image_bytes, render = read_upload()
+        # Заголовок проверяется сразу: негодный файл не занимает место в очереди
+        sniff_image(image_bytes)
+        job_id = get_job_runner().submit(image_bytes, render, ticket)
+
+    except ImageRejected as e:
+        release(ticket)
+        return jsonify({'error': str(e), 'reason': e.reason}), 422
+
+    except UploadError as e:
+        release(ticket)
+        return jsonify({'error': str(e)}), 400
+
+    except QueueFull as e:
+        release(ticket)
+        response = jsonify({'error': 'Сервер перегружен, повторите попытку позже'})
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response, 429
+
+    except Exception:
+        release(ticket)
+        raise
+
+    status_url = f"/jobs/{job_id}"
+    return jsonify({'job_id': job_id, 'status': 'queued', 'status_url': status_url}), 202, {'Location': status_url}
+
+
+@app.route('/jobs/<job_id>')
+def get_job(job_id):
+    """Статус задачи; ?wait=N — long-poll до N секунд (не больше JOB_MAX_WAIT)."""
+    store = get_job_runner().store
+    wait = min(max(request.args.get('wait', 0, type=float), 0.0), JOB_MAX_WAIT)
+    job = store.wait(job_id, wait) if wait > 0 else store.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Задача не найдена'}), 404
+
+    body = {'job_id': job_id, 'status': job['status']}
+    if job['status'] == 'done':
+        body['result'] = json.loads(job['result'])
+    elif job['status'] == 'failed':
+        body['error'] = f"Ошибка обработки: {job['error']}"
+    return jsonify(body)
+
+
+@app.route('/live', methods=['POST'])
+def create_live_session():
+    """Начинает живую проверку с камеры; кадры — POST на frames_url."""
+    session_id = get_live_sessions().create()
+    return jsonify({
+        'session_id': session_id,
+        'frames_url': f"/live/{session_id}/frames",
+        'frame_size': LIVE_FRAME_SIZE,
+    }), 201
+
+
+@app.route('/live/<session_id>/frames', methods=['POST'])
+def live_frame(session_id):
+    """Очередной кадр сессии; ответ — текущий чек-лист по всем кадрам."""
+    store = get_live_sessions()
+    state = store.load(session_id)
+    if state is None:
+        return jsonify({'error': 'Сессия не найдена или истекла'}), 404
+
+    try:
+        with admitted(LIVE_FRAME_COST):
+            image_bytes, _ = read_upload()
+            body = inspect_frame(state, image_bytes)
+
+    except Rejected as e:
+        return rejected_response(e)
+
+    except ImageRejected as e:
+        return jsonify({'error': str(e), 'reason': e.reason}), 422
+
+    except UploadError as e:
+        return jsonify({'error': str(e)}), 400
+
+    except Exception as e:
+        return jsonify({'error': f'Ошибка обработки: {str(e)}'}), 500
+
+    store.save(session_id, state)
+    return jsonify(body)
+
+
+@app.route('/live/<session_id>', methods=['DELETE'])
+def end_live_session(session_id):
+    """Завершает сессию живой проверки."""
+    get_live_sessions().delete(session_id)
+    return '', 204
+
+
 if __name__ == '__main__':
     # Создаем папки если их нет
     Path('templates').mkdir(exist_ok=True)
@@ -340,6 +1926,11 @@ if __name__ == '__main__':
     print("Host: 0.0.0.0")
     sys.stdout.flush()
 
+    if os.environ.get('MODEL_PRELOAD', '1') == '1':
+        print("Loading and warming up the model...")
+        sys.stdout.flush()
+        warm_up_model()
+
     try:
         # Запускаем без лишнего вывода
         print("Calling app.run()...")
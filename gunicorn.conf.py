@@ -0,0 +1,122 @@
+"""Конфигурация gunicorn: предзагрузка модели в мастере и прогрев воркеров."""
+
+import math
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from serving import topology as medkit_topology
+
+# Воркеры, потоки запросов и потоки torch / OpenCV / BLAS — из одной политики по лимиту
+# CPU контейнера. Приоритет: GUNICORN_WORKERS / GUNICORN_THREADS / INFERENCE_THREADS,
+# затем файл scripts.tune_topology (TOPOLOGY_FILE), затем политика по умолчанию.
+TOPOLOGY = medkit_topology.resolve(
+    Path(os.environ.get('TOPOLOGY_FILE', Path(__file__).resolve().parent / 'topology.json'))
+)
+
+# MODEL_SERVER=1: модель живёт в MODEL_SERVER_PROCESSES отдельных процессах
+# (model_server.py), воркеры передают им изображения через Unix-сокет и общую память.
+# Ядра CPU делятся между серверами модели; воркеры только декодируют и рисуют.
+MODEL_SERVER = os.environ.get('MODEL_SERVER', '0') == '1'
+MODEL_SERVER_PROCESSES = int(os.environ.get('MODEL_SERVER_PROCESSES', 1))
+MODEL_SERVER_THREADS = int(os.environ.get('MODEL_SERVER_THREADS', 0)) or max(
+    1, math.floor(TOPOLOGY.cpus) // MODEL_SERVER_PROCESSES
+)
+MODEL_SERVER_DIR = Path(tempfile.gettempdir()) / 'medkit' / 'model-server'
+model_server_processes = []
+if MODEL_SERVER:
+    TOPOLOGY.inference_threads = 1
+    os.environ['MODEL_SERVER_SOCKET'] = ','.join(
+        str(MODEL_SERVER_DIR / f'model-{i}.sock') for i in range(MODEL_SERVER_PROCESSES)
+    )
+
+# До импорта приложения: OpenMP / BLAS читают эти переменные при загрузке
+medkit_topology.export_env(TOPOLOGY)
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+workers = TOPOLOGY.workers
+threads = TOPOLOGY.threads
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+accesslog = '-'
+errorlog = '-'
+
+# Веса загружаются один раз в мастере до fork — воркеры делят страницы copy-on-write
+preload_app = os.environ.get('MODEL_PRELOAD', '1') == '1'
+
+# Метрики Prometheus в многопроцессном режиме: каждый процесс пишет свои файлы,
+# /metrics суммирует их. Каталог очищается при старте мастера (до импорта app).
+metrics_dir = Path(os.environ.setdefault(
+    'PROMETHEUS_MULTIPROC_DIR', str(Path(tempfile.gettempdir()) / 'medkit' / 'prometheus')
+))
+shutil.rmtree(metrics_dir, ignore_errors=True)
+metrics_dir.mkdir(parents=True, exist_ok=True)
+
+
+def on_starting(server):
+    server.log.info("Topology: %s", TOPOLOGY)
+    if not MODEL_SERVER:
+        return
+
+    env = dict(os.environ, INFERENCE_THREADS=str(MODEL_SERVER_THREADS))
+    env.update(dict.fromkeys(medkit_topology.BLAS_ENV_VARS, str(MODEL_SERVER_THREADS)))
+    entrypoint = Path(__file__).resolve().parent / 'model_server.py'
+    for socket_path in os.environ['MODEL_SERVER_SOCKET'].split(','):
+        model_server_processes.append(subprocess.Popen([sys.executable, str(entrypoint), socket_path], env=env))
+    server.log.info("Started %d model server(s) with %d inference thread(s) each",
+                    len(model_server_processes), MODEL_SERVER_THREADS)
+
+
+def on_exit(server):
+    for process in model_server_processes:
+        process.terminate()
+    for process in model_server_processes:
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def when_ready(server):
+    # В режиме сервера модели мастеру нечего загружать
+    if not preload_app or MODEL_SERVER:
+        return
+    import app as medkit_app
+
+    started = time.perf_counter()
+    # Реестр моделей опрашивают воркеры; мастер держит загруженную версию для fork
+    medkit_app.MODEL_REGISTRY_WATCH = False
+    medkit_app.get_model()
+    server.log.info("Model loaded in master in %.1f s", time.perf_counter() - started)
+
+
+def post_worker_init(worker):
+    # Воркер начинает принимать запросы только после возврата из этого хука. Без preload
+    # модель грузится здесь же: иначе /ready отвечал бы 503 до первого запроса /process
+    import app as medkit_app
+
+    started = time.perf_counter()
+    medkit_app.MODEL_REGISTRY_WATCH = True
+    medkit_app.warm_up_model()
+    worker.log.info("Worker %s warmed up in %.1f s", worker.pid, time.perf_counter() - started)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
+    import app as medkit_app
+
+    # Очередь задач воркера пропала вместе с ним: клиенты узнают об этом сразу, а не по heartbeat
+    failed = medkit_app.get_job_runner().store.fail_process(worker.pid)
+    if failed:
+        server.log.info("Marked %d job(s) of worker %s as failed", failed, worker.pid)
+
+    # Билеты допуска убитого воркера (таймаут, OOM) иначе держали бы лимиты его клиентов
+    if os.environ.get('ADMISSION_ENABLED', '0') == '1':
+        released = medkit_app.get_admission().release_process(worker.pid)
+        if released:
+            server.log.info("Released %d admission ticket(s) of worker %s", released, worker.pid)
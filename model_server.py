@@ -0,0 +1,67 @@
+"""Сервер модели: одна прогретая копия YOLO для всех воркеров gunicorn.
+
+    python model_server.py /tmp/medkit/model-server/model-0.sock
+
+Обычно запускается из gunicorn.conf.py при MODEL_SERVER=1. Сокет открывается
+только после загрузки и прогрева модели; запросы воркеров, пришедшие одновременно,
+объединяются микробатчингом приложения (INFERENCE_BATCH_SIZE).
+"""
+
+import argparse
+import os
+import signal
+import sys
+import threading
+import time
+from pathlib import Path
+
+# Сервер сам выполняет инференс, а не пересылает его дальше
+os.environ.pop('MODEL_SERVER_SOCKET', None)
+
+import app as medkit_app  # noqa: E402
+from serving import deadline as request_deadline  # noqa: E402
+from serving.model_server import ModelServer  # noqa: E402
+
+
+def watch_parent(server: ModelServer, parent_pid: int) -> None:
+    """Останавливает сервер, если родительский процесс (мастер gunicorn) завершился."""
+    while os.getppid() == parent_pid:
+        time.sleep(1.0)
+    server.shutdown()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('socket', type=Path, help='путь Unix-сокета')
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    medkit_app.warm_up_model()
+
+    def info() -> dict:
+        model, version = medkit_app.get_active_model()
+        return {'version': version, 'names': model.names}
+
+    def predict(images: list, imgsz: int, augment: bool, deadline: float | None) -> tuple[list, dict]:
+        # Модель берётся на каждый запрос: реестр моделей может подменить её на лету
+        model, version = medkit_app.get_active_model()
+        # Запрос, не попавший в батч до дедлайна воркера, снимается с очереди
+        with request_deadline.scope(None if deadline is None else request_deadline.Deadline(deadline)):
+            results = medkit_app.predict_group(model, images, imgsz, augment)
+        return [result.boxes.data.cpu().numpy() for result in results], {'version': version, 'names': model.names}
+
+    server = ModelServer(args.socket, predict, info)
+    # SIGTERM от мастера gunicorn — штатная остановка с удалением сокета
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    threading.Thread(target=watch_parent, args=(server, os.getppid()), daemon=True).start()
+    print(f"[INFO] Model server {os.getpid()} ready on {args.socket} in {time.perf_counter() - started:.1f} s",
+          flush=True)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        args.socket.unlink(missing_ok=True)
+
+
+if __name__ == "__main__":
+    main()
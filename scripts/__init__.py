@@ -0,0 +1 @@
+"""Офлайн-скрипты сервиса: экспорт моделей, проверки и бенчмарки (запуск: python -m scripts.<имя>)."""
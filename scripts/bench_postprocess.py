@@ -0,0 +1,209 @@
+"""
+bench_postprocess.py — паритет и микробенчмарк векторизованной постобработки детекций.
+
+Сравнивает app.detections_from_result() + app.filter_detections() (массивы NumPy)
+с прежней реализацией, обходившей боксы по одному через объекты DetectedObject:
+итоговые классы, confidence и боксы должны совпадать в точности. Входы — синтетические
+результаты ultralytics (сотни боксов, совпадающие confidence и площади) и, если задан
+--images, реальные предсказания модели (новая версия — с classes= до NMS).
+
+    python -m scripts.bench_postprocess --cases 500
+    python -m scripts.bench_postprocess --images Learn_model/data/raw/valid/images --limit 20
+"""
+
+import argparse
+import time
+from collections.abc import Callable
+from pathlib import Path
+
+import cv2
+import numpy as np
+import torch
+from ultralytics.engine.results import Results
+
+import app
+from scripts.evaluation import list_images
+
+# ------------------------- прежняя реализация (эталон) -------------------------
+
+
+def legacy_raw_detect(result, img_area: float) -> list[app.DetectedObject]:
+    objects = []
+    for box in result.boxes:
+        cls_name = result.names[int(box.cls[0])]
+        obj = app.DetectedObject(cls_name, float(box.conf[0]), box.xyxy[0].cpu().numpy())
+        if cls_name not in app.REQUIRED_ITEMS or obj.area > img_area * app.MAX_BOX_AREA_RATIO:
+            continue
+        objects.append(obj)
+    return objects
+
+
+def legacy_classify_bandages(bandages: list[app.DetectedObject]) -> list[app.DetectedObject]:
+    bandages = [b for b in bandages if b.conf >= app.HIGH_CONF]
+    if not bandages:
+        return []
+
+    bandages.sort(key=lambda x: x.area, reverse=True)
+    max_gap, split_idx = 0.0, -1
+    for i in range(len(bandages) - 1):
+        denom = bandages[i + 1].area if bandages[i + 1].area > 0 else 1e-6
+        if bandages[i].area / denom > max_gap:
+            max_gap, split_idx = bandages[i].area / denom, i
+    gap_confirmed = max_gap >= app.BANDAGE_GAP_THRESHOLD
+
+    if gap_confirmed:
+        for i, bandage in enumerate(bandages):
+            bandage.cls_name = 'Large bandage' if i <= split_idx else 'small bandage'
+    else:
+        votes_large = sum(1 for b in bandages if 'Large' in b.cls_name)
+        votes_small = len(bandages) - votes_large
+        if votes_large > votes_small:
+            winner = 'Large bandage'
+        elif votes_small > votes_large:
+            winner = 'small bandage'
+        else:
+            avg_large = np.mean([b.area for b in bandages if 'Large' in b.cls_name]) if votes_large > 0 else 0
+            avg_small = np.mean([b.area for b in bandages if 'small' in b.cls_name]) if votes_small > 0 else 0
+            winner = 'Large bandage' if avg_large >= avg_small else 'small bandage'
+        for bandage in bandages:
+            bandage.cls_name = winner
+
+    large_group = [b for b in bandages if 'Large' in b.cls_name]
+    small_group = [b for b in bandages if 'small' in b.cls_name]
+    if gap_confirmed:
+        large_group.sort(key=lambda x: x.area, reverse=True)
+        small_group.sort(key=lambda x: x.area, reverse=True)
+        while len(large_group) > 3 and len(small_group) < 3:
+            item = large_group.pop()
+            item.cls_name = 'small bandage'
+            small_group.insert(0, item)
+        while len(small_group) > 3 and len(large_group) < 3:
+            item = small_group.pop(0)
+            item.cls_name = 'Large bandage'
+            large_group.append(item)
+
+    large_group.sort(key=lambda x: x.conf, reverse=True)
+    small_group.sort(key=lambda x: x.conf, reverse=True)
+    return large_group[:3] + small_group[:3]
+
+
+def legacy_two_tier_filter(objects: list[app.DetectedObject]) -> list[app.DetectedObject]:
+    grouped: dict[str, list[app.DetectedObject]] = {}
+    for obj in objects:
+        grouped.setdefault(obj.cls_name, []).append(obj)
+
+    result = []
+    for cls_name, limit in app.REQUIRED_ITEMS.items():
+        if 'bandage' in cls_name.lower():
+            continue
+        candidates = grouped.get(cls_name, [])
+        candidates.sort(key=lambda x: x.conf, reverse=True)
+        selected = [obj for obj in candidates if obj.conf >= app.HIGH_CONF][:limit]
+        remaining = limit - len(selected)
+        if remaining > 0:
+            selected.extend([obj for obj in candidates if obj.conf < app.HIGH_CONF][:remaining])
+        result.extend(selected)
+    return result
+
+
+def legacy_pipeline(result, img_area: float) -> list[app.DetectedObject]:
+    raw_objects = legacy_raw_detect(result, img_area)
+    bandages = [obj for obj in raw_objects if 'bandage' in obj.cls_name.lower()]
+    others = [obj for obj in raw_objects if 'bandage' not in obj.cls_name.lower()]
+    return legacy_classify_bandages(bandages) + legacy_two_tier_filter(others)
+
+
+def vectorized_pipeline(result, img_area: float) -> list[app.DetectedObject]:
+    return app.filter_detections(app.detections_from_result(result, img_area))
+
+
+# ------------------------------------------------------------------------------
+
+
+def as_tuples(objects: list[app.DetectedObject]) -> list[tuple]:
+    return [(obj.cls_name, obj.conf, tuple(obj.box.tolist())) for obj in objects]
+
+
+def synthetic_result(rng: np.random.Generator, names: dict[int, str], max_boxes: int) -> tuple[Results, float]:
+    """Случайный результат детекции: округлённые confidence и повторяющиеся размеры дают равенства."""
+    height, width = 960, 1280
+    count = int(rng.integers(0, max_boxes + 1))
+    bandage_ids = [cls_id for cls_id, name in names.items() if 'bandage' in name.lower()]
+    cls = rng.choice(list(names), size=count).astype(np.float32)
+    # Часть боксов — бинты, чтобы чаще срабатывали ветки classify_bandages
+    bandage_mask = rng.random(count) < 0.3
+    cls[bandage_mask] = rng.choice(bandage_ids, size=int(bandage_mask.sum()))
+    sizes = rng.choice([20, 40, 41, 80, 160, 300, 1200], size=(count, 2)).astype(np.float32)
+    x1 = rng.uniform(0, width - 40, count).astype(np.float32)
+    y1 = rng.uniform(0, height - 40, count).astype(np.float32)
+    conf = np.round(rng.uniform(app.LOW_CONF, 1.0, count), 2).astype(np.float32)
+    data = np.column_stack([x1, y1, x1 + sizes[:, 0], y1 + sizes[:, 1], conf, cls])
+    image = np.zeros((height, width, 3), dtype=np.uint8)
+    return Results(image, path='', names=names, boxes=torch.from_numpy(data)), float(height * width)
+
+
+def time_per_call(pipeline: Callable, cases: list, repeats: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeats):
+        for result, img_area in cases:
+            pipeline(result, img_area)
+    return (time.perf_counter() - started) / (repeats * len(cases))
+
+
+def model_cases(images_dir: Path, limit: int) -> list[tuple]:
+    """Пары (результат без classes=, результат с classes=) реальной модели на одних и тех же фото."""
+    model = app.get_model()
+    relevant = np.flatnonzero(app.class_lookup(model.names) >= 0).tolist()
+    cases = []
+    for path in list_images(images_dir, limit):
+        image = cv2.imread(str(path))
+        kwargs = {'conf': app.LOW_CONF, 'iou': 0.5, 'imgsz': app.IMG_SIZE, 'augment': True, 'verbose': False}
+        legacy = model.predict(image, **kwargs)[0]
+        vectorized = model.predict(image, classes=relevant, **kwargs)[0]
+        cases.append((legacy, vectorized, float(image.shape[0] * image.shape[1])))
+    return cases
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--cases', type=int, default=500, help='синтетических результатов')
+    parser.add_argument('--max-boxes', type=int, default=400, help='максимум боксов в результате')
+    parser.add_argument('--repeats', type=int, default=3, help='повторов замера')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--images', type=Path, default=None, help='фото для проверки на реальной модели')
+    parser.add_argument('--limit', type=int, default=20)
+    args = parser.parse_args()
+
+    # Классы модели: комплект и лишний класс, который постобработка должна отбросить
+    names = dict(enumerate(sorted([*app.REQUIRED_ITEMS, 'Medical wipes'])))
+    rng = np.random.default_rng(args.seed)
+    cases = [synthetic_result(rng, names, args.max_boxes) for _ in range(args.cases)]
+
+    mismatches = sum(
+        as_tuples(legacy_pipeline(result, img_area)) != as_tuples(vectorized_pipeline(result, img_area))
+        for result, img_area in cases
+    )
+    print(f"[INFO] Synthetic parity: {len(cases) - mismatches}/{len(cases)} identical")
+
+    if args.images:
+        real = model_cases(args.images, args.limit)
+        real_mismatches = sum(
+            as_tuples(legacy_pipeline(legacy, img_area)) != as_tuples(vectorized_pipeline(vectorized, img_area))
+            for legacy, vectorized, img_area in real
+        )
+        print(f"[INFO] Model parity: {len(real) - real_mismatches}/{len(real)} identical")
+        mismatches += real_mismatches
+
+    legacy_time = time_per_call(legacy_pipeline, cases, args.repeats)
+    vectorized_time = time_per_call(vectorized_pipeline, cases, args.repeats)
+    mean_boxes = np.mean([len(result.boxes) for result, _ in cases])
+    print(f"[INFO] {mean_boxes:.0f} boxes per result on average")
+    print(f"[INFO] legacy:     {legacy_time * 1000:.3f} ms per result")
+    print(f"[INFO] vectorized: {vectorized_time * 1000:.3f} ms per result ({legacy_time / vectorized_time:.1f}x)")
+
+    if mismatches:
+        raise SystemExit(f"[ERROR] Results differ in {mismatches} case(s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+bench_tiling.py — тайловый инференс против TTA@1280: задержка и полнота мелких классов.
+
+Оба режима прогоняются через тот же пайплайн, что и /process
+(raw_detect → filter_detections) на размеченной валидационной выборке. Для каждого
+режима печатаются средняя и p95 задержка и полнота (recall) по мелким классам:
+доля размеченных предметов, для которых в итоговых детекциях есть бокс того же
+класса с IoU >= --iou.
+
+    python -m scripts.bench_tiling --data Learn_model/configs/data_raw.yaml --limit 50
+    TILE_SIZE=800 TILE_MAX_SIDE=2560 python -m scripts.bench_tiling
+"""
+
+import argparse
+import json
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+import app
+from scripts.evaluation import DEFAULT_DATA, count_unmatched, load_labels, load_validation_set
+
+DEFAULT_CLASSES = 'pencil,Adhesive plaster,small bandage'
+
+
+def evaluate(model, images: list[Path], names: list[str], classes: list[str], tiled: bool, iou: float) -> dict:
+    """Задержка и полнота по классам classes для одного режима."""
+    latencies = []
+    totals = dict.fromkeys(classes, 0)
+    found = dict.fromkeys(classes, 0)
+
+    for path in images:
+        image = cv2.imread(str(path))
+        if image is None:
+            raise SystemExit(f"Не удалось прочитать изображение: {path}")
+        height, width = image.shape[:2]
+
+        started = time.perf_counter()
+        raw_objects = app.raw_detect(model, image, height * width, tiled=tiled)
+        objects = app.filter_detections(raw_objects)
+        latencies.append(time.perf_counter() - started)
+
+        ref_boxes, ref_names = load_labels(path, names, width, height)
+        boxes = np.array([obj.box for obj in objects], dtype=np.float32).reshape(-1, 4)
+        for cls_name in classes:
+            ref_mask = np.array([name == cls_name for name in ref_names], dtype=bool)
+            mask = np.array([obj.cls_name == cls_name for obj in objects], dtype=bool)
+            total = int(ref_mask.sum())
+            if not total:
+                continue
+            unmatched = count_unmatched(
+                ref_boxes[ref_mask], np.zeros(total, dtype=int), boxes[mask], np.zeros(int(mask.sum()), dtype=int), iou
+            )
+            totals[cls_name] += total
+            found[cls_name] += total - unmatched
+
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        'latency_ms': {
+            'mean': round(float(latencies_ms.mean()), 1),
+            'p95': round(float(np.percentile(latencies_ms, 95)), 1),
+        },
+        'recall': {name: round(found[name] / totals[name], 4) if totals[name] else None for name in classes},
+        'labels': totals,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--data', type=Path, default=DEFAULT_DATA, help='data.yaml с валидационной выборкой')
+    parser.add_argument('--limit', type=int, default=None, help='сколько изображений взять')
+    parser.add_argument('--classes', default=DEFAULT_CLASSES, help='мелкие классы через запятую')
+    parser.add_argument('--iou', type=float, default=0.5)
+    parser.add_argument('--output', type=Path, default=None, help='куда сохранить JSON-отчёт')
+    args = parser.parse_args()
+
+    images, names = load_validation_set(args.data)
+    images = images[:args.limit] if args.limit else images
+    classes = [name.strip() for name in args.classes.split(',') if name.strip()]
+    model = app.get_model()
+    app.warm_up_model()
+    # Прогрев тайлового режима: форма батча другая, чем у TTA
+    app.raw_detect(model, cv2.imread(str(images[0])), 1.0, tiled=True)
+
+    report = {
+        'images': len(images),
+        'tiling': {
+            'tile_size': app.TILE_SIZE,
+            'overlap': app.TILE_OVERLAP,
+            'max_side': app.TILE_MAX_SIDE,
+        },
+        f'tta@{app.IMG_SIZE}': evaluate(model, images, names, classes, tiled=False, iou=args.iou),
+        'tiled': evaluate(model, images, names, classes, tiled=True, iou=args.iou),
+    }
+
+    for mode in (f'tta@{app.IMG_SIZE}', 'tiled'):
+        result = report[mode]
+        recall = ', '.join(f"{name} {value:.1%}" if value is not None else f"{name} —"
+                           for name, value in result['recall'].items())
+        print(f"[INFO] {mode:>9}: mean {result['latency_ms']['mean']} ms, p95 {result['latency_ms']['p95']} ms; "
+              f"recall: {recall}")
+
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2, ensure_ascii=False) + '\n', encoding='utf-8')
+        print(f"[DONE] Report: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
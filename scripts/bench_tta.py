@@ -0,0 +1,117 @@
+"""
+bench_tta.py — TTA одним батчем (TTA_BATCHED) против augment=True ultralytics.
+
+Оба режима прогоняются через тот же пайплайн, что и /process
+(raw_detect → filter_detections) на одних и тех же фото. Печатаются средняя и p95
+задержка каждого режима и паритет детекций: согласие итоговых боксов (F1 пар того же
+класса с IoU >= --iou, augment=True — эталон) и доля фото с тем же вердиктом
+(одинаковое число предметов каждого класса). Код выхода 1, если среднее согласие
+ниже --min-agreement.
+
+    python -m scripts.bench_tta --images Learn_model/data/raw/valid/images --limit 30
+    TTA_FUSION=wbf python -m scripts.bench_tta --output tta.json
+"""
+
+import argparse
+import json
+import time
+from collections import Counter
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+import app
+from scripts.evaluation import DEFAULT_IMAGES_DIR, count_unmatched, list_images
+
+
+def detect(model, image: np.ndarray, batched: bool) -> tuple[list[app.DetectedObject], float]:
+    """Итоговые объекты и время пайплайна для одного режима TTA."""
+    app.TTA_BATCHED = batched
+    started = time.perf_counter()
+    objects = app.filter_detections(app.raw_detect(model, image, image.shape[0] * image.shape[1]))
+    return objects, time.perf_counter() - started
+
+
+def agreement(reference: list[app.DetectedObject], candidate: list[app.DetectedObject], iou: float) -> float:
+    """F1 совпадения двух наборов боксов (пары того же класса с IoU >= iou)."""
+    if not reference and not candidate:
+        return 1.0
+
+    def arrays(objects):
+        boxes = np.array([obj.box for obj in objects], dtype=np.float32).reshape(-1, 4)
+        return boxes, np.array([app.REQUIRED_NAMES.index(obj.cls_name) for obj in objects], dtype=int)
+
+    ref_boxes, ref_cls = arrays(reference)
+    boxes, cls = arrays(candidate)
+    matched = len(reference) - count_unmatched(ref_boxes, ref_cls, boxes, cls, iou)
+    return 2 * matched / (len(reference) + len(candidate))
+
+
+def latency_summary(latencies: list[float]) -> dict:
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        'mean': round(float(latencies_ms.mean()), 1),
+        'p95': round(float(np.percentile(latencies_ms, 95)), 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--images', type=Path, default=DEFAULT_IMAGES_DIR, help='каталог эталонных фото')
+    parser.add_argument('--limit', type=int, default=30, help='сколько фото взять')
+    parser.add_argument('--iou', type=float, default=0.5)
+    parser.add_argument('--min-agreement', type=float, default=0.9, help='минимальное среднее согласие')
+    parser.add_argument('--output', type=Path, default=None, help='куда сохранить JSON-отчёт')
+    args = parser.parse_args()
+
+    paths = list_images(args.images, args.limit)
+    if not paths:
+        raise SystemExit(f"[ERROR] Нет изображений в {args.images}")
+    model = app.get_model()
+    # Прогрев обоих режимов: у батча видов другая форма входа
+    warm_up_image = cv2.imread(str(paths[0]))
+    for batched in (False, True):
+        detect(model, warm_up_image, batched)
+
+    latencies = {False: [], True: []}
+    agreements, same_verdict = [], 0
+    for path in paths:
+        image = cv2.imread(str(path))
+        if image is None:
+            raise SystemExit(f"[ERROR] Не удалось прочитать изображение: {path}")
+        reference, reference_time = detect(model, image, batched=False)
+        candidate, candidate_time = detect(model, image, batched=True)
+        latencies[False].append(reference_time)
+        latencies[True].append(candidate_time)
+        agreements.append(agreement(reference, candidate, args.iou))
+        same_verdict += Counter(obj.cls_name for obj in reference) == Counter(obj.cls_name for obj in candidate)
+
+    report = {
+        'images': len(paths),
+        'tta': {'scales': app.TTA_SCALES, 'flips': app.TTA_FLIPS, 'fusion': app.TTA_FUSION},
+        'augment': {'latency_ms': latency_summary(latencies[False])},
+        'batched': {'latency_ms': latency_summary(latencies[True])},
+        'parity': {
+            'mean_agreement': round(float(np.mean(agreements)), 4),
+            'min_agreement': round(float(np.min(agreements)), 4),
+            'same_verdict': round(same_verdict / len(paths), 4),
+        },
+    }
+
+    for mode in ('augment', 'batched'):
+        latency = report[mode]['latency_ms']
+        print(f"[INFO] {mode:>8}: mean {latency['mean']} ms, p95 {latency['p95']} ms")
+    parity = report['parity']
+    print(f"[INFO] Parity: agreement mean {parity['mean_agreement']:.1%}, min {parity['min_agreement']:.1%}; "
+          f"same verdict on {parity['same_verdict']:.1%} of images")
+
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2, ensure_ascii=False) + '\n', encoding='utf-8')
+        print(f"[DONE] Report: {args.output}")
+    if parity['mean_agreement'] < args.min_agreement:
+        raise SystemExit(f"[ERROR] Agreement {parity['mean_agreement']:.1%} below {args.min_agreement:.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,303 @@
+"""
+benchmark.py — нагрузочный бенчмарк сервиса под gunicorn.
+
+Поднимает app:app через gunicorn.conf.py с заданным числом воркеров и потоков,
+ждёт /ready и прогоняет корпус фото аптечек и синтетические изображения
+нескольких разрешений при растущей конкурентности. Отчёт (JSON) содержит
+пропускную способность, p50/p95/p99 задержки, загрузку CPU и пиковый RSS
+каждого воркера — его можно сравнивать между коммитами:
+
+    python -m scripts.benchmark --workers 2 --threads 2 --output bench.json
+    python -m scripts.benchmark --baseline bench.json --max-regression 0.15
+
+Кэш результатов на время бенчмарка выключен (иначе повторы не доходят до модели).
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from scripts.evaluation import ROOT_DIR, list_images
+
+DEFAULT_RESOLUTIONS = '640x480,1920x1080,4032x3024'
+DEFAULT_CONCURRENCY = '1,2,4,8'
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+
+
+def synthetic_image(width: int, height: int, seed: int) -> bytes:
+    """Воспроизводимое синтетическое JPEG-фото: фон-градиент и прямоугольники."""
+    rng = np.random.default_rng(seed)
+    gradient = np.linspace(60, 200, width, dtype=np.float32)
+    image = np.repeat(np.repeat(gradient[None, :, None], height, axis=0), 3, axis=2).astype(np.uint8)
+    for _ in range(20):
+        x1, y1 = int(rng.integers(0, width - 10)), int(rng.integers(0, height - 10))
+        x2, y2 = x1 + int(rng.integers(10, max(11, width // 4))), y1 + int(rng.integers(10, max(11, height // 4)))
+        color = tuple(int(c) for c in rng.integers(0, 255, 3))
+        cv2.rectangle(image, (x1, y1), (x2, y2), color, -1)
+    _, buffer = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, 90])
+    return buffer.tobytes()
+
+
+def load_corpus(corpus_dir: Path | None, resolutions: list[tuple[int, int]], limit: int) -> list[tuple[str, bytes]]:
+    """Фото корпуса и синтетические изображения: список (имя, байты JPEG/PNG)."""
+    samples = []
+    if corpus_dir is not None:
+        samples.extend((path.name, path.read_bytes()) for path in list_images(corpus_dir, limit))
+    for index, (width, height) in enumerate(resolutions):
+        samples.append((f"synthetic_{width}x{height}.jpg", synthetic_image(width, height, seed=index)))
+    return samples
+
+
+def multipart_body(filename: str, data: bytes) -> tuple[bytes, str]:
+    """Тело multipart/form-data с одним полем image."""
+    boundary = uuid.uuid4().hex
+    head = (
+        f'--{boundary}\r\n'
+        f'Content-Disposition: form-data; name="image"; filename="{filename}"\r\n'
+        f'Content-Type: application/octet-stream\r\n\r\n'
+    ).encode()
+    return head + data + f'\r\n--{boundary}--\r\n'.encode(), f'multipart/form-data; boundary={boundary}'
+
+
+def proc_children(pid: int) -> list[int]:
+    """Дочерние процессы (воркеры gunicorn) по /proc."""
+    try:
+        return [int(p) for p in Path(f'/proc/{pid}/task/{pid}/children').read_text().split()]
+    except OSError:
+        return []
+
+
+def proc_cpu_seconds(pid: int) -> float:
+    """Процессорное время процесса (user + system), с."""
+    try:
+        fields = Path(f'/proc/{pid}/stat').read_text().rsplit(')', 1)[1].split()
+    except OSError:
+        return 0.0
+    return (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+
+
+def proc_peak_rss_mb(pid: int) -> float:
+    """Пиковый RSS процесса (VmHWM), МБ."""
+    try:
+        for line in Path(f'/proc/{pid}/status').read_text().splitlines():
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+
+def wait_ready(base_url: str, server: subprocess.Popen, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise SystemExit(f"[ERROR] gunicorn завершился с кодом {server.returncode}")
+        try:
+            with urllib.request.urlopen(f'{base_url}/ready', timeout=2) as response:
+                if response.status == 200:
+                    return
+        except (urllib.error.URLError, OSError):
+            pass
+        time.sleep(0.5)
+    raise SystemExit("[ERROR] Сервис не стал ready за отведённое время")
+
+
+def send(url: str, sample: tuple[str, bytes]) -> tuple[float, int]:
+    """Один запрос; возвращает (задержка в секундах, HTTP-статус)."""
+    body, content_type = multipart_body(*sample)
+    req = urllib.request.Request(url, data=body, headers={'Content-Type': content_type}, method='POST')
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=300) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except (urllib.error.URLError, OSError):
+        status = 0
+    return time.perf_counter() - started, status
+
+
+def run_level(url: str, samples: list, concurrency: int, requests: int, master_pid: int) -> dict:
+    """Прогон одного уровня конкурентности."""
+    pids = [master_pid, *proc_children(master_pid)]
+    cpu_before = sum(proc_cpu_seconds(pid) for pid in pids)
+    started = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda i: send(url, samples[i % len(samples)]), range(requests)))
+
+    wall = time.perf_counter() - started
+    cpu_seconds = sum(proc_cpu_seconds(pid) for pid in pids) - cpu_before
+    latencies = np.array([latency for latency, status in results if status == 200]) * 1000
+    errors = sum(1 for _, status in results if status != 200)
+
+    level = {
+        'concurrency': concurrency,
+        'requests': requests,
+        'errors': errors,
+        'wall_seconds': round(wall, 3),
+        'throughput_rps': round(len(latencies) / wall, 3) if wall > 0 else 0.0,
+        'latency_ms': {},
+        'cpu_seconds': round(cpu_seconds, 3),
+        'cpu_percent': round(100 * cpu_seconds / wall, 1) if wall > 0 else 0.0,
+        'peak_rss_mb_per_worker': {
+            str(pid): round(proc_peak_rss_mb(pid), 1) for pid in proc_children(master_pid)
+        },
+    }
+    if len(latencies):
+        level['latency_ms'] = {
+            'mean': round(float(latencies.mean()), 1),
+            'p50': round(float(np.percentile(latencies, 50)), 1),
+            'p95': round(float(np.percentile(latencies, 95)), 1),
+            'p99': round(float(np.percentile(latencies, 99)), 1),
+            'max': round(float(latencies.max()), 1),
+        }
+    return level
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=ROOT_DIR, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def run_benchmark(
+    workers: int,
+    threads: int,
+    samples: list[tuple[str, bytes]],
+    concurrency_levels: list[int],
+    requests_per_level: int,
+    port: int = 5099,
+    path: str = '/process?render=boxes',
+    extra_env: dict[str, str] | None = None,
+    ready_timeout: float = 300.0,
+) -> dict:
+    """Поднимает gunicorn с заданной топологией, прогоняет уровни и возвращает отчёт."""
+    env = {
+        **os.environ,
+        'PORT': str(port),
+        'GUNICORN_WORKERS': str(workers),
+        'GUNICORN_THREADS': str(threads),
+        'RESULT_CACHE_ENABLED': '0',
+        'SINGLE_FLIGHT_ENABLED': '0',
+        'STATE_DIR': tempfile.mkdtemp(prefix='medkit-bench-'),
+        **(extra_env or {}),
+    }
+    command = [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'app:app']
+    base_url = f'http://127.0.0.1:{port}'
+
+    with open(Path(env['STATE_DIR']) / 'gunicorn.log', 'wb') as log:
+        server = subprocess.Popen(command, cwd=ROOT_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+        try:
+            wait_ready(base_url, server, ready_timeout)
+            # Ждём, пока прогреются все воркеры, а не только первый
+            time.sleep(1.0)
+            levels = []
+            for concurrency in concurrency_levels:
+                level = run_level(base_url + path, samples, concurrency, requests_per_level, server.pid)
+                print(f"[INFO] workers={workers} threads={threads} c={concurrency}: "
+                      f"{level['throughput_rps']} rps, p95 {level['latency_ms'].get('p95')} ms, "
+                      f"errors {level['errors']}")
+                levels.append(level)
+        finally:
+            server.terminate()
+            server.wait(timeout=60)
+
+    return {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'cpu_count': os.cpu_count(),
+            'workers': workers,
+            'threads': threads,
+            'path': path,
+            'samples': [name for name, _ in samples],
+            'env': extra_env or {},
+        },
+        'levels': levels,
+    }
+
+
+def compare(report: dict, baseline: dict, max_regression: float) -> bool:
+    """Сравнивает p95 и пропускную способность с базовым отчётом; False при регрессии."""
+    ok = True
+    baseline_levels = {level['concurrency']: level for level in baseline['levels']}
+    for level in report['levels']:
+        base = baseline_levels.get(level['concurrency'])
+        if base is None or not level['latency_ms'] or not base['latency_ms']:
+            continue
+        p95_change = level['latency_ms']['p95'] / base['latency_ms']['p95'] - 1
+        rps_change = level['throughput_rps'] / base['throughput_rps'] - 1 if base['throughput_rps'] else 0.0
+        regressed = p95_change > max_regression or rps_change < -max_regression
+        ok &= not regressed
+        print(f"[{'REGRESSION' if regressed else 'OK'}] c={level['concurrency']}: "
+              f"p95 {p95_change:+.1%}, throughput {rps_change:+.1%}")
+    return ok
+
+
+def parse_resolutions(value: str) -> list[tuple[int, int]]:
+    return [tuple(int(v) for v in item.split('x')) for item in value.split(',') if item]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=2)
+    parser.add_argument('--port', type=int, default=5099)
+    parser.add_argument('--corpus', type=Path, default=None, help='каталог с фото аптечек')
+    parser.add_argument('--corpus-limit', type=int, default=20)
+    parser.add_argument('--resolutions', default=DEFAULT_RESOLUTIONS, help='синтетические изображения, WxH через запятую')
+    parser.add_argument('--concurrency', default=DEFAULT_CONCURRENCY, help='уровни конкурентности через запятую')
+    parser.add_argument('--requests', type=int, default=20, help='запросов на уровень')
+    parser.add_argument('--path', default='/process?render=boxes', help='эндпоинт и параметры запроса')
+    parser.add_argument('--env', action='append', default=[], metavar='KEY=VALUE',
+                        help='переменные окружения сервиса (например, CASCADE_ENABLED=1)')
+    parser.add_argument('--output', type=Path, default=None, help='куда сохранить JSON-отчёт')
+    parser.add_argument('--baseline', type=Path, default=None, help='отчёт для сравнения')
+    parser.add_argument('--max-regression', type=float, default=0.15,
+                        help='допустимое ухудшение p95 / пропускной способности')
+    args = parser.parse_args()
+
+    samples = load_corpus(args.corpus, parse_resolutions(args.resolutions), args.corpus_limit)
+    extra_env = dict(item.split('=', 1) for item in args.env)
+    report = run_benchmark(
+        args.workers,
+        args.threads,
+        samples,
+        [int(c) for c in args.concurrency.split(',')],
+        args.requests,
+        port=args.port,
+        path=args.path,
+        extra_env=extra_env,
+    )
+
+    text = json.dumps(report, indent=2, ensure_ascii=False, sort_keys=True)
+    if args.output:
+        args.output.write_text(text + '\n', encoding='utf-8')
+        print(f"[DONE] Report: {args.output}")
+    else:
+        print(text)
+
+    if args.baseline and not compare(report, json.loads(args.baseline.read_text(encoding='utf-8')),
+                                      args.max_regression):
+        raise SystemExit("[ERROR] Регрессия производительности относительно базового отчёта")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Общие помощники офлайн-скриптов: список изображений и сравнение детекций."""
+
+from pathlib import Path
+
+import numpy as np
+import yaml
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+
+# Фиксированный набор изображений для проверок — валидационная выборка Learn_model
+DEFAULT_IMAGES_DIR = ROOT_DIR / 'Learn_model' / 'data' / 'raw' / 'valid' / 'images'
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.bmp')
+# Разметка Learn_model: data.yaml с валидационной выборкой и именами классов
+DEFAULT_DATA = ROOT_DIR / 'Learn_model' / 'configs' / 'data_raw.yaml'
+
+
+def list_images(images_dir: Path, limit: int | None = None) -> list[Path]:
+    """Отсортированный (воспроизводимый) список изображений каталога."""
+    if not images_dir.is_dir():
+        raise SystemExit(f"Каталог с изображениями не найден: {images_dir}")
+    images = sorted(p for p in images_dir.iterdir() if p.suffix.lower() in IMAGE_EXTENSIONS)
+    if not images:
+        raise SystemExit(f"В каталоге нет изображений: {images_dir}")
+    return images[:limit] if limit else images
+
+
+def load_validation_set(data_path: Path) -> tuple[list[Path], list[str]]:
+    """Изображения валидационной выборки и имена классов из data.yaml."""
+    with open(data_path, encoding='utf-8') as f:
+        data = yaml.safe_load(f)
+    images_dir = (data_path.parent / data['val']).resolve()
+    return list_images(images_dir), list(data['names'])
+
+
+def label_path(image_path: Path) -> Path:
+    """Файл YOLO-разметки изображения (images/x.jpg -> labels/x.txt)."""
+    return image_path.parent.parent / 'labels' / f"{image_path.stem}.txt"
+
+
+def load_labels(image_path: Path, names: list[str], width: int, height: int) -> tuple[np.ndarray, list[str]]:
+    """Боксы разметки в пикселях xyxy (N, 4) и имена их классов."""
+    path = label_path(image_path)
+    rows = []
+    if path.exists():
+        rows = [line.split() for line in path.read_text(encoding='utf-8').splitlines() if line.strip()]
+    if not rows:
+        return np.zeros((0, 4), dtype=np.float32), []
+    values = np.array([[float(v) for v in row[1:5]] for row in rows], dtype=np.float32)
+    cx, cy, w, h = values[:, 0] * width, values[:, 1] * height, values[:, 2] * width, values[:, 3] * height
+    boxes = np.stack([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2], axis=1)
+    return boxes, [names[int(row[0])] for row in rows]
+
+
+def box_iou(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Попарный IoU боксов xyxy: (N, 4) x (M, 4) -> (N, M)."""
+    if len(a) == 0 or len(b) == 0:
+        return np.zeros((len(a), len(b)), dtype=np.float32)
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-9)
+
+
+def count_unmatched(
+    ref_boxes: np.ndarray,
+    ref_cls: np.ndarray,
+    boxes: np.ndarray,
+    cls: np.ndarray,
+    iou_threshold: float,
+) -> int:
+    """Сколько эталонных боксов не нашли пару того же класса с IoU >= порога."""
+    iou = box_iou(ref_boxes, boxes)
+    if iou.size:
+        iou[ref_cls[:, None] != cls[None, :]] = 0.0
+    used: set[int] = set()
+    unmatched = 0
+    for i in range(len(ref_boxes)):
+        candidates = [j for j in np.argsort(-iou[i]) if j not in used and iou[i, j] >= iou_threshold] if iou.size else []
+        if candidates:
+            used.add(int(candidates[0]))
+        else:
+            unmatched += 1
+    return unmatched
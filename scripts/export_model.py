@@ -0,0 +1,120 @@
+"""
+export_model.py — экспорт best.pt в ONNX / OpenVINO и проверка паритета с PyTorch.
+
+Экспортированная модель кладётся рядом с best.pt под именем, которое ожидает
+app.get_backend_model_path(). Затем на фиксированном наборе изображений
+сравниваются боксы и классы PyTorch-модели и экспортированной модели —
+через raw_detect на IMG_SIZE, обе без TTA. --augment сравнивает их с TTA, как
+в /process; TTA ultralytics есть только у PyTorch, поэтому --augment требует
+TTA_BATCHED=1 (TTA одним батчем работает на любом бэкенде). Набор изображений,
+на котором нет ни одного уверенного бокса, проверку не проходит.
+
+    python -m scripts.export_model --backend onnx
+    python -m scripts.export_model --backend openvino --images path/to/images --limit 50
+"""
+
+import argparse
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+from ultralytics import YOLO
+
+import app
+from scripts.evaluation import DEFAULT_IMAGES_DIR, count_unmatched, list_images
+
+
+def export(backend: str, imgsz: int) -> None:
+    """Экспорт весов PyTorch в формат бэкенда (динамические batch и размер входа)."""
+    weights_path = app.get_model_path()
+    print(f"[INFO] Export {weights_path} -> {backend}")
+    model = YOLO(str(weights_path))
+    model.export(format=backend, imgsz=imgsz, dynamic=True, half=False)
+
+
+def check_parity(
+    backend: str,
+    images: list,
+    imgsz: int,
+    augment: bool,
+    iou_threshold: float,
+    max_mismatch: float,
+) -> bool:
+    """Сравнивает детекции PyTorch и бэкенда; True, если расхождения в пределах допуска."""
+    reference = YOLO(str(app.get_backend_model_path('torch')), task='detect')
+    candidate = YOLO(str(app.get_backend_model_path(backend)), task='detect')
+
+    total = 0
+    mismatched = 0
+    timings: dict[str, list[float]] = {'torch': [], backend: []}
+
+    for image_path in images:
+        image = cv2.imread(str(image_path))
+        if image is None:
+            print(f"[WARNING] Не удалось прочитать {image_path.name}")
+            continue
+
+        outputs = {}
+        for name, model in (('torch', reference), (backend, candidate)):
+            started = time.perf_counter()
+            detections = app.raw_detect(model, image, image.shape[0] * image.shape[1], imgsz, augment)
+            timings[name].append(time.perf_counter() - started)
+            outputs[name] = detections.boxes, detections.cls, detections.conf
+
+        ref_boxes, ref_cls, ref_conf = outputs['torch']
+        boxes, cls, conf = outputs[backend]
+
+        # Уверенные боксы одной модели должны найтись среди всех боксов другой
+        ref_strong = ref_conf >= app.HIGH_CONF
+        strong = conf >= app.HIGH_CONF
+        missed = count_unmatched(ref_boxes[ref_strong], ref_cls[ref_strong], boxes, cls, iou_threshold)
+        extra = count_unmatched(boxes[strong], cls[strong], ref_boxes, ref_cls, iou_threshold)
+
+        total += int(ref_strong.sum() + strong.sum())
+        mismatched += missed + extra
+        if missed or extra:
+            print(f"  {image_path.name}: пропущено {missed}, лишних {extra}")
+
+    if not total:
+        print("[ERROR] Ни одного уверенного бокса: набор изображений ничего не проверяет")
+        return False
+    ratio = mismatched / total
+    for name, values in timings.items():
+        if values:
+            print(f"[INFO] {name:8s} latency: mean {np.mean(values) * 1000:.1f} ms, "
+                  f"p95 {np.percentile(values, 95) * 1000:.1f} ms")
+    print(f"[INFO] Parity: {mismatched} of {total} confident boxes mismatched ({ratio:.2%}), "
+          f"tolerance {max_mismatch:.2%}")
+    return ratio <= max_mismatch
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--backend', choices=['onnx', 'openvino'], required=True)
+    parser.add_argument('--imgsz', type=int, default=app.IMG_SIZE)
+    parser.add_argument('--augment', action='store_true',
+                        help='сравнивать с TTA, как в /process (нужен TTA_BATCHED=1)')
+    parser.add_argument('--images', type=Path, default=DEFAULT_IMAGES_DIR,
+                        help='каталог фиксированного набора изображений для проверки паритета')
+    parser.add_argument('--limit', type=int, default=50, help='сколько изображений проверять')
+    parser.add_argument('--iou', type=float, default=0.9, help='минимальный IoU совпадающих боксов')
+    parser.add_argument('--max-mismatch', type=float, default=0.02, help='допустимая доля расхождений')
+    parser.add_argument('--skip-export', action='store_true', help='только проверка паритета')
+    args = parser.parse_args()
+
+    if args.augment and not app.TTA_BATCHED:
+        # Иначе PyTorch прошёл бы с TTA ultralytics, а бэкенд — без него: сравнивались бы разные пайплайны
+        parser.error('--augment требует TTA_BATCHED=1: TTA ultralytics выполняет только PyTorch')
+
+    if not args.skip_export:
+        export(args.backend, args.imgsz)
+
+    images = list_images(args.images, args.limit)
+    if not check_parity(args.backend, images, args.imgsz, args.augment, args.iou, args.max_mismatch):
+        raise SystemExit("[ERROR] Паритет с PyTorch не подтверждён")
+    print("[DONE] Parity OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+model_registry.py — управление реестром версий модели (MODEL_REGISTRY_DIR).
+
+Работающий сервис замечает изменение manifest.json за MODEL_REGISTRY_POLL секунд,
+загружает и прогревает активную версию в фоне и переключается на неё без перезапуска.
+Откат — activate предыдущей версии или rollback.
+
+    python -m scripts.model_registry add 2026-10-01 runs/train/exp/weights/best.pt --note "ещё 300 фото"
+    python -m scripts.model_registry activate 2026-10-01
+    python -m scripts.model_registry rollback
+    python -m scripts.model_registry list
+"""
+
+import argparse
+import os
+from pathlib import Path
+
+from serving.model_registry import ModelRegistry, RegistryError
+
+# Те же суффиксы экспортированных моделей, что ищет app.get_backend_model_path()
+ARTIFACT_SUFFIXES = ('.onnx', '_openvino_model', '_int8_openvino_model')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--registry', type=Path, default=os.environ.get('MODEL_REGISTRY_DIR'),
+                        help='каталог реестра (по умолчанию MODEL_REGISTRY_DIR)')
+    commands = parser.add_subparsers(dest='command', required=True)
+    add = commands.add_parser('add', help='добавить версию (веса и экспортированные рядом модели)')
+    add.add_argument('version')
+    add.add_argument('weights', type=Path)
+    add.add_argument('--note', default='')
+    add.add_argument('--activate', action='store_true', help='сразу сделать версию активной')
+    activate = commands.add_parser('activate', help='переключить сервис на версию')
+    activate.add_argument('version')
+    commands.add_parser('rollback', help='вернуть предыдущую активную версию')
+    commands.add_parser('list', help='версии реестра')
+    args = parser.parse_args()
+
+    if args.registry is None:
+        parser.error("Укажите --registry или MODEL_REGISTRY_DIR")
+    registry = ModelRegistry(args.registry)
+
+    try:
+        if args.command == 'add':
+            path = registry.add(args.version, args.weights, note=args.note, artifacts=ARTIFACT_SUFFIXES)
+            print(f"[DONE] Added {args.version}: {path}")
+            if args.activate:
+                previous = registry.activate(args.version)
+                print(f"[DONE] Active: {previous} -> {args.version}")
+        elif args.command == 'activate':
+            previous = registry.activate(args.version)
+            print(f"[DONE] Active: {previous} -> {args.version}")
+        elif args.command == 'rollback':
+            manifest = registry.manifest()
+            version = registry.rollback()
+            print(f"[DONE] Rolled back: {manifest['active']} -> {version}")
+        else:
+            manifest = registry.manifest()
+            for version, entry in manifest['versions'].items():
+                marker = '*' if version == manifest['active'] else ' '
+                print(f"{marker} {version}  {entry['sha256'][:12]}  {entry['added']}  {entry['note']}")
+    except RegistryError as e:
+        raise SystemExit(f"[ERROR] {e}") from None
+
+
+if __name__ == "__main__":
+    main()
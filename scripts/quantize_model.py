@@ -0,0 +1,105 @@
+"""
+quantize_model.py — INT8-версия детектора (OpenVINO + NNCF) с проверкой точности.
+
+Пост-тренировочная квантизация калибруется на валидационных изображениях
+Learn_model. Затем FP32 best.pt и INT8-модель прогоняются через тот же
+пайплайн, что и /process (raw_detect → filter_detections → build_result),
+с одинаковыми настройками — TTA только при TTA_BATCHED, единственном варианте TTA,
+доступном OpenVINO, — и их вердикты сравниваются с разметкой. Если точность комплектности INT8
+ниже FP32 больше чем на --margin, модель не публикуется.
+
+    python -m scripts.quantize_model
+    python -m scripts.quantize_model --data Learn_model/configs/data_raw.yaml --margin 0.01
+
+Опубликованная модель используется при INFERENCE_BACKEND=openvino-int8.
+"""
+
+import argparse
+import shutil
+import tempfile
+from collections import Counter
+from pathlib import Path
+
+import cv2
+from ultralytics import YOLO
+
+import app
+from scripts.evaluation import DEFAULT_DATA, label_path, load_validation_set
+
+
+def ground_truth_verdict(image_path: Path, names: list[str]) -> tuple[bool, list[str]]:
+    """Вердикт комплектности по YOLO-разметке изображения."""
+    labels = label_path(image_path)
+    found: Counter = Counter()
+    if labels.exists():
+        for line in labels.read_text(encoding='utf-8').splitlines():
+            if line.strip():
+                found[names[int(line.split()[0])]] += 1
+    is_complete, _, missing = app.build_result(found)
+    return is_complete, missing
+
+
+def predicted_verdict(model: YOLO, image_path: Path, imgsz: int) -> tuple[bool, list[str]]:
+    """Вердикт комплектности тем же пайплайном, что и /process.
+
+    augment=True ultralytics работает только у PyTorch-модели: FP32 и INT8 сравниваются
+    либо обе с TTA одним батчем (TTA_BATCHED), либо обе без TTA.
+    """
+    image = cv2.imread(str(image_path))
+    if image is None:
+        raise ValueError(f"Не удалось прочитать изображение: {image_path}")
+    raw_objects = app.raw_detect(model, image, image.shape[0] * image.shape[1], imgsz, augment=app.TTA_BATCHED)
+    filtered_objects = app.filter_detections(raw_objects)
+    is_complete, _, missing = app.build_result(Counter(obj.cls_name for obj in filtered_objects))
+    return is_complete, missing
+
+
+def completeness_accuracy(model: YOLO, images: list[Path], names: list[str], imgsz: int) -> float:
+    """Доля изображений, где вердикт модели (статус и список недостающего) совпал с разметкой."""
+    correct = sum(predicted_verdict(model, path, imgsz) == ground_truth_verdict(path, names) for path in images)
+    return correct / len(images)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--data', type=Path, default=DEFAULT_DATA, help='data.yaml с валидационной выборкой')
+    parser.add_argument('--imgsz', type=int, default=app.IMG_SIZE)
+    parser.add_argument('--margin', type=float, default=0.02,
+                        help='допустимое падение точности комплектности относительно FP32')
+    args = parser.parse_args()
+
+    weights_path = app.get_model_path()
+    target_path = weights_path.with_name(weights_path.stem + app.BACKEND_ARTIFACTS['openvino-int8'])
+    images, names = load_validation_set(args.data)
+    print(f"[INFO] Validation images: {len(images)}")
+
+    with tempfile.TemporaryDirectory(dir=weights_path.parent) as staging_dir:
+        # Экспорт во временный каталог: до проверки точности модель не публикуется
+        staged_weights = Path(staging_dir) / weights_path.name
+        shutil.copy2(weights_path, staged_weights)
+        staged_model = Path(YOLO(str(staged_weights)).export(
+            format='openvino',
+            int8=True,
+            data=str(args.data),
+            imgsz=args.imgsz,
+            dynamic=True,
+        ))
+
+        fp32_accuracy = completeness_accuracy(YOLO(str(weights_path), task='detect'), images, names, args.imgsz)
+        int8_accuracy = completeness_accuracy(YOLO(str(staged_model), task='detect'), images, names, args.imgsz)
+        drop = fp32_accuracy - int8_accuracy
+        print(f"[INFO] Completeness accuracy: FP32 {fp32_accuracy:.2%}, INT8 {int8_accuracy:.2%}, "
+              f"drop {drop:.2%} (margin {args.margin:.2%})")
+
+        if drop > args.margin:
+            raise SystemExit("[ERROR] INT8-модель не опубликована: падение точности превышает допуск")
+
+        if target_path.exists():
+            shutil.rmtree(target_path)
+        shutil.move(str(staged_model), target_path)
+
+    print(f"[DONE] INT8 model published: {target_path}")
+
+
+if __name__ == "__main__":
+    main()
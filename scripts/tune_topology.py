@@ -0,0 +1,103 @@
+"""
+tune_topology.py — подбор разбиения CPU между процессами и потоками на целевой машине.
+
+Для каждого варианта (воркеры gunicorn × потоки torch на воркер, в сумме — лимит CPU,
+× потоки запросов) запускает scripts.benchmark и выбирает вариант с наибольшей
+пропускной способностью на самом высоком уровне конкурентности (с ограничением на p95,
+если задан --max-p95-ms). Результат пишется в topology.json, который читает gunicorn.conf.py:
+
+    python -m scripts.tune_topology --corpus Learn_model/data/raw/valid/images
+"""
+
+import argparse
+import json
+import math
+from pathlib import Path
+
+from scripts.benchmark import DEFAULT_RESOLUTIONS, load_corpus, parse_resolutions, run_benchmark
+from scripts.evaluation import ROOT_DIR
+from serving.topology import cpu_limit
+
+
+def candidates(cores: int, max_workers: int, thread_options: list[int]) -> list[tuple[int, int, int]]:
+    """Варианты (workers, threads, inference_threads) без переподписки CPU."""
+    options = []
+    for workers in range(1, min(max_workers, cores) + 1):
+        inference_threads = max(1, cores // workers)
+        # Оставляем только варианты, где ядра делятся нацело или почти нацело
+        if workers > 1 and workers * inference_threads < cores - 1:
+            continue
+        options.extend((workers, threads, inference_threads) for threads in thread_options)
+    return options
+
+
+def score(report: dict, max_p95_ms: float | None) -> float:
+    """Пропускная способность на максимальной конкурентности; 0, если нарушен p95 или были ошибки."""
+    level = report['levels'][-1]
+    if level['errors'] or not level['latency_ms']:
+        return 0.0
+    if max_p95_ms is not None and level['latency_ms']['p95'] > max_p95_ms:
+        return 0.0
+    return level['throughput_rps']
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--cpus', type=float, default=None, help='лимит CPU (по умолчанию — из cgroup)')
+    parser.add_argument('--max-workers', type=int, default=4)
+    parser.add_argument('--threads', default='1,2,4', help='варианты потоков gunicorn через запятую')
+    parser.add_argument('--corpus', type=Path, default=None, help='каталог с фото аптечек')
+    parser.add_argument('--corpus-limit', type=int, default=20)
+    parser.add_argument('--resolutions', default=DEFAULT_RESOLUTIONS)
+    parser.add_argument('--concurrency', default='2,8', help='уровни конкурентности через запятую')
+    parser.add_argument('--requests', type=int, default=24, help='запросов на уровень')
+    parser.add_argument('--max-p95-ms', type=float, default=None, help='ограничение на p95 при выборе')
+    parser.add_argument('--port', type=int, default=5099)
+    parser.add_argument('--output', type=Path, default=ROOT_DIR / 'topology.json')
+    args = parser.parse_args()
+
+    cores = max(1, math.floor(args.cpus or cpu_limit()))
+    samples = load_corpus(args.corpus, parse_resolutions(args.resolutions), args.corpus_limit)
+    concurrency = [int(c) for c in args.concurrency.split(',')]
+
+    results = []
+    for workers, threads, inference_threads in candidates(
+        cores, args.max_workers, [int(t) for t in args.threads.split(',')]
+    ):
+        report = run_benchmark(
+            workers,
+            threads,
+            samples,
+            concurrency,
+            args.requests,
+            port=args.port,
+            extra_env={'INFERENCE_THREADS': str(inference_threads)},
+        )
+        level = report['levels'][-1]
+        results.append({
+            'workers': workers,
+            'threads': threads,
+            'inference_threads': inference_threads,
+            'score': score(report, args.max_p95_ms),
+            'throughput_rps': level['throughput_rps'],
+            'latency_ms': level['latency_ms'],
+        })
+
+    best = max(results, key=lambda r: r['score'])
+    if best['score'] <= 0:
+        raise SystemExit("[ERROR] Ни один вариант не уложился в ограничения — topology.json не записан")
+
+    topology = {
+        'cpus': cores,
+        'workers': best['workers'],
+        'threads': best['threads'],
+        'inference_threads': best['inference_threads'],
+        'benchmark': results,
+    }
+    args.output.write_text(json.dumps(topology, indent=2, ensure_ascii=False) + '\n', encoding='utf-8')
+    print(f"[DONE] workers={best['workers']} threads={best['threads']} "
+          f"inference_threads={best['inference_threads']}: {best['throughput_rps']} rps -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
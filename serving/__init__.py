@@ -0,0 +1 @@
+"""Инфраструктура сервинга модели: планировщики, хранилища состояния и т.п."""
@@ -0,0 +1,129 @@
+"""Контроль допуска к инференсу: корзины токенов клиентов и учёт выполняемых запросов, общие для воркеров."""
+
+import math
+import sqlite3
+import time
+import uuid
+from contextlib import suppress
+
+from serving.state import SqliteStore
+
+
+class Rejected(Exception):
+    """Запрос не допущен; reason — причина, retry_after — через сколько секунд стоит повторить."""
+
+    def __init__(self, reason: str, message: str, retry_after: int):
+        super().__init__(message)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionStore(SqliteStore):
+    """Лимиты на весь контейнер: состояние в SQLite, решение — в одной транзакции.
+
+    Клиенту (IP или API-ключ) начисляется rate токенов в секунду, не больше burst;
+    запрос тратит cost токенов (rate = 0 — без ограничения частоты), запрос из многих
+    частей (/bulk) — ещё и токены за каждую часть через charge. Допущенный
+    запрос получает билет, который отдаётся по завершении работы (для задач /jobs —
+    после выполнения, поэтому очередь задач тоже учитывается). Одновременно у клиента
+    не больше client_max_inflight билетов, у процесса — не больше worker_max_inflight
+    (0 — без предела). Билеты процесса, убитого без release, удаляет release_process
+    (или они истекают через ticket_ttl).
+    """
+
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS buckets (
+            client TEXT PRIMARY KEY,
+            tokens REAL NOT NULL,
+            updated REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS tickets (
+            id TEXT PRIMARY KEY,
+            client TEXT NOT NULL,
+            pid INTEGER NOT NULL,
+            started REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS tickets_client ON tickets (client);
+        CREATE INDEX IF NOT EXISTS tickets_pid ON tickets (pid);
+    '''
+
+    def __init__(
+        self,
+        path,
+        rate: float,
+        burst: float,
+        client_max_inflight: int = 2,
+        worker_max_inflight: int = 0,
+        ticket_ttl: float = 600.0,
+        busy_retry_after: int = 2,
+    ):
+        super().__init__(path)
+        self.rate = rate
+        self.burst = burst
+        self.client_max_inflight = client_max_inflight
+        self.worker_max_inflight = worker_max_inflight
+        self.ticket_ttl = ticket_ttl
+        self.busy_retry_after = busy_retry_after
+
+    def acquire(self, client: str, pid: int, cost: float = 1.0) -> str | None:
+        """Билет на выполнение запроса клиента в процессе pid; иначе Rejected.
+
+        None — база заблокирована: запрос допускается без учёта, а не отклоняется.
+        """
+        try:
+            return self._acquire(client, pid, cost)
+        except sqlite3.OperationalError:
+            return None
+
+    def _acquire(self, client: str, pid: int, cost: float) -> str:
+        now = time.time()
+        with self.transaction() as conn:
+            conn.execute('DELETE FROM tickets WHERE started < ?', (now - self.ticket_ttl,))
+            # Перегрузка проверяется до списания токенов: отказ из-за неё клиента не штрафует
+            if self.worker_max_inflight > 0:
+                (worker_inflight,) = conn.execute('SELECT COUNT(*) FROM tickets WHERE pid = ?', (pid,)).fetchone()
+                if worker_inflight >= self.worker_max_inflight:
+                    raise Rejected('overloaded', 'Сервер перегружен', self.busy_retry_after)
+            (client_inflight,) = conn.execute('SELECT COUNT(*) FROM tickets WHERE client = ?', (client,)).fetchone()
+            if client_inflight >= self.client_max_inflight:
+                raise Rejected('concurrency', 'Слишком много одновременных проверок', self.busy_retry_after)
+
+            if self.rate > 0:
+                self._take_tokens(conn, client, cost, now)
+
+            ticket = uuid.uuid4().hex
+            conn.execute(
+                'INSERT INTO tickets (id, client, pid, started) VALUES (?, ?, ?, ?)', (ticket, client, pid, now)
+            )
+        return ticket
+
+    def _take_tokens(self, conn: sqlite3.Connection, client: str, cost: float, now: float) -> None:
+        row = conn.execute('SELECT tokens, updated FROM buckets WHERE client = ?', (client,)).fetchone()
+        tokens = self.burst if row is None else min(self.burst, row[0] + (now - row[1]) * self.rate)
+        if tokens < cost:
+            raise Rejected('rate', 'Слишком много запросов', max(1, math.ceil((cost - tokens) / self.rate)))
+        conn.execute(
+            'INSERT OR REPLACE INTO buckets (client, tokens, updated) VALUES (?, ?, ?)',
+            (client, tokens - cost, now),
+        )
+        # Корзины, которые успели бы наполниться, ничего не ограничивают — их можно забыть
+        conn.execute('DELETE FROM buckets WHERE updated < ?', (now - self.burst / self.rate,))
+
+    def charge(self, client: str, cost: float = 1.0) -> None:
+        """Списывает cost токенов клиента без билета (части запроса, уже допущенного по билету); иначе Rejected.
+
+        База заблокирована — токены не списываются, как и в acquire.
+        """
+        if self.rate <= 0:
+            return
+        with suppress(sqlite3.OperationalError), self.transaction() as conn:
+            self._take_tokens(conn, client, cost, time.time())
+
+    def release(self, ticket: str | None) -> None:
+        if ticket is not None:
+            with suppress(sqlite3.OperationalError):
+                self.connect().execute('DELETE FROM tickets WHERE id = ?', (ticket,))
+
+    def release_process(self, pid: int) -> int:
+        """Удаляет билеты завершившегося процесса; возвращает их число."""
+        return self.connect().execute('DELETE FROM tickets WHERE pid = ?', (pid,)).rowcount
@@ -0,0 +1,102 @@
+"""Динамический микробатчинг запросов к модели внутри одного процесса."""
+
+import os
+import threading
+import time
+from collections import deque
+from collections.abc import Callable, Hashable
+from concurrent.futures import Future
+from typing import Any
+
+
+class _Pending:
+    def __init__(self, key: Hashable, item: Any):
+        self.key = key
+        self.item = item
+        self.future: Future = Future()
+        self.enqueued_at = time.monotonic()
+
+
+class BatchScheduler:
+    """Собирает запросы в течение max_wait_ms и выполняет их одним батчем.
+
+    В один батч попадают только запросы с одинаковым ключом (например,
+    одинаковыми настройками predict). Результаты возвращаются через Future.
+    """
+
+    def __init__(
+        self,
+        run_batch: Callable[[Hashable, list[Any]], list[Any]],
+        max_batch_size: int = 4,
+        max_wait_ms: float = 5.0,
+        name: str = 'batch-scheduler',
+        on_batch: Callable[[list[float]], None] | None = None,
+    ):
+        self.run_batch = run_batch
+        self.on_batch = on_batch  # получает время ожидания каждого запроса батча, с
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.name = name
+        self._queue: deque[_Pending] = deque()
+        self._cond = threading.Condition()
+        self._thread: threading.Thread | None = None
+        self._pid: int | None = None
+
+    def submit(self, item: Any, key: Hashable = None) -> Future:
+        """Ставит элемент в очередь и возвращает Future с его результатом."""
+        pending = _Pending(key, item)
+        with self._cond:
+            self._ensure_started()
+            self._queue.append(pending)
+            self._cond.notify()
+        return pending.future
+
+    def _ensure_started(self) -> None:
+        # После fork (gunicorn) поток родителя в дочернем процессе не существует
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        self._pid = os.getpid()
+        self._thread = threading.Thread(target=self._loop, name=self.name, daemon=True)
+        self._thread.start()
+
+    def _take_batch(self) -> list[_Pending]:
+        """Ждёт первый запрос, затем добирает батч с тем же ключом."""
+        with self._cond:
+            while not self._queue:
+                self._cond.wait()
+            first = self._queue.popleft()
+            batch = [first]
+            deadline = time.monotonic() + self.max_wait
+
+            while len(batch) < self.max_batch_size:
+                same_key = [p for p in self._queue if p.key == first.key]
+                for pending in same_key[:self.max_batch_size - len(batch)]:
+                    self._queue.remove(pending)
+                    batch.append(pending)
+                if len(batch) >= self.max_batch_size:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            return batch
+
+    def _loop(self) -> None:
+        while True:
+            batch = [p for p in self._take_batch() if p.future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            if self.on_batch is not None:
+                now = time.monotonic()
+                self.on_batch([now - p.enqueued_at for p in batch])
+            try:
+                results = self.run_batch(batch[0].key, [p.item for p in batch])
+                if len(results) != len(batch):
+                    raise RuntimeError(f"run_batch вернул {len(results)} результатов вместо {len(batch)}")
+            except Exception as e:
+                for pending in batch:
+                    pending.future.set_exception(e)
+                continue
+            for pending, result in zip(batch, results, strict=True):
+                pending.future.set_result(result)
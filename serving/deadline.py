@@ -0,0 +1,125 @@
+"""Бюджет задержки запроса: дедлайн, отмена ожидания по нему и оценка стоимости уровней качества.
+
+Дедлайн хранится в contextvar потока, обрабатывающего запрос: его видят ожидание
+микробатча и клиент сервера модели, не требуя протаскивать параметр через весь пайплайн.
+"""
+
+import threading
+import time
+from collections.abc import Iterator
+from concurrent.futures import Future
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any
+
+_CURRENT: ContextVar['Deadline | None'] = ContextVar('medkit_deadline', default=None)
+
+
+class DeadlineExceeded(TimeoutError):
+    """Запрос не укладывается в бюджет задержки; работа по нему отменена."""
+
+
+class Deadline:
+    """Момент (time.time()), к которому запрос должен быть обработан."""
+
+    def __init__(self, expires_at: float):
+        self.expires_at = expires_at
+
+    @classmethod
+    def after(cls, budget: float, started: float | None = None) -> 'Deadline':
+        """Дедлайн через budget секунд после started (по умолчанию — сейчас)."""
+        return cls((time.time() if started is None else started) + budget)
+
+    def remaining(self) -> float:
+        return self.expires_at - time.time()
+
+    def check(self, stage: str) -> None:
+        """DeadlineExceeded, если время уже вышло (stage — для сообщения)."""
+        if self.remaining() <= 0:
+            raise DeadlineExceeded(f"Бюджет задержки исчерпан до этапа {stage}")
+
+
+def parse_request_start(value: str | None, now: float | None = None) -> float | None:
+    """Момент приёма запроса прокси из заголовка X-Request-Start ('t=1700000000.123').
+
+    Прокси пишут секунды, миллисекунды или микросекунды — единица определяется по
+    величине. Некорректное значение или момент в будущем — None.
+    """
+    if not value:
+        return None
+    try:
+        started = float(value.strip().removeprefix('t='))
+    except ValueError:
+        return None
+    while started > 1e11:
+        started /= 1000
+    now = time.time() if now is None else now
+    return started if 0 < started <= now else None
+
+
+def current() -> Deadline | None:
+    """Дедлайн запроса, обрабатываемого в этом потоке (None — без бюджета)."""
+    return _CURRENT.get()
+
+
+def check(stage: str) -> None:
+    """Проверка дедлайна текущего потока перед этапом stage (без бюджета — ничего)."""
+    deadline = current()
+    if deadline is not None:
+        deadline.check(stage)
+
+
+@contextmanager
+def scope(deadline: Deadline | None) -> Iterator[None]:
+    """Делает deadline дедлайном текущего потока на время блока."""
+    token = _CURRENT.set(deadline)
+    try:
+        yield
+    finally:
+        _CURRENT.reset(token)
+
+
+def wait(future: Future) -> Any:
+    """Результат future не позже дедлайна; не дождались — future отменяется.
+
+    Ещё не начатая работа снимается с очереди (BatchScheduler пропускает отменённые),
+    уже идущий батч доработает, но его результат этому запросу не нужен.
+    """
+    deadline = current()
+    if deadline is None:
+        return future.result()
+    try:
+        return future.result(timeout=max(0.0, deadline.remaining()))
+    except TimeoutError:
+        if future.done():
+            raise
+        future.cancel()
+        raise DeadlineExceeded("Инференс не уложился в бюджет задержки") from None
+
+
+class CostEstimates:
+    """Скользящая (EWMA) оценка длительности каждого уровня качества в этом процессе.
+
+    Оценка старше ttl секунд забывается: уровень, от которого отказались под нагрузкой,
+    снова пробуется, когда нагрузка спадёт, а не остаётся «слишком дорогим» навсегда.
+    """
+
+    def __init__(self, alpha: float = 0.3, ttl: float = 60.0):
+        self.alpha = alpha
+        self.ttl = ttl
+        self._costs: dict[str, tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+    def estimate(self, level: str) -> float | None:
+        with self._lock:
+            return self._estimate(level)
+
+    def observe(self, level: str, seconds: float) -> None:
+        with self._lock:
+            previous = self._estimate(level)
+            cost = seconds if previous is None else previous + self.alpha * (seconds - previous)
+            self._costs[level] = (cost, time.monotonic())
+
+    def _estimate(self, level: str) -> float | None:
+        cost, updated = self._costs.get(level, (None, 0.0))
+        return cost if time.monotonic() - updated <= self.ttl else None
@@ -0,0 +1,208 @@
+"""Асинхронные задачи: ограниченная очередь перед инференсом и общий статус задач."""
+
+import math
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+from collections.abc import Callable
+from contextlib import suppress
+
+from serving.state import SqliteStore
+
+
+class QueueFull(Exception):
+    """Очередь задач заполнена; retry_after — через сколько секунд стоит повторить."""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Очередь задач заполнена, повторите через {retry_after} с")
+        self.retry_after = retry_after
+
+
+class JobStore(SqliteStore):
+    """Статусы и результаты задач, видимые из любого воркера gunicorn.
+
+    Очередь задачи — в памяти воркера pid, который её принял; пока задача не завершена,
+    он обновляет heartbeat. Задача, чей воркер умер (fail_process) или не отмечался
+    дольше stale_after секунд, становится failed — клиент не ждёт её до истечения ttl.
+    """
+
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            status TEXT NOT NULL,
+            result TEXT,
+            error TEXT,
+            created REAL NOT NULL,
+            updated REAL NOT NULL,
+            pid INTEGER NOT NULL DEFAULT 0,
+            heartbeat REAL NOT NULL DEFAULT 0
+        );
+    '''
+    ORPHANED_ERROR = 'воркер, выполнявший задачу, завершился'
+
+    def __init__(self, path, ttl: float = 600.0, stale_after: float = 30.0):
+        super().__init__(path)
+        self.ttl = ttl
+        self.stale_after = stale_after
+
+    def connect(self) -> sqlite3.Connection:
+        fresh = getattr(self._local, 'conn', None) is None or self._local.pid != os.getpid()
+        conn = super().connect()
+        if fresh:
+            # База, созданная до появления pid/heartbeat: её задачи считаются брошенными
+            columns = {row[1] for row in conn.execute('PRAGMA table_info(jobs)')}
+            for column in ('pid INTEGER NOT NULL DEFAULT 0', 'heartbeat REAL NOT NULL DEFAULT 0'):
+                if column.split()[0] not in columns:
+                    with suppress(sqlite3.OperationalError):
+                        conn.execute(f'ALTER TABLE jobs ADD COLUMN {column}')
+        return conn
+
+    def create(self, job_id: str, pid: int | None = None) -> None:
+        now = time.time()
+        with self.transaction() as conn:
+            conn.execute('DELETE FROM jobs WHERE updated < ?', (now - self.ttl,))
+            conn.execute(
+                "INSERT INTO jobs (id, status, created, updated, pid, heartbeat) VALUES (?, 'queued', ?, ?, ?, ?)",
+                (job_id, now, now, os.getpid() if pid is None else pid, now),
+            )
+
+    def heartbeat(self, pid: int) -> None:
+        """Отметка, что воркер pid жив и его незавершённые задачи ещё выполнятся."""
+        self.connect().execute(
+            "UPDATE jobs SET heartbeat = ? WHERE pid = ? AND status IN ('queued', 'running')", (time.time(), pid)
+        )
+
+    def fail_process(self, pid: int) -> int:
+        """Помечает failed незавершённые задачи завершившегося процесса; возвращает их число."""
+        return self.connect().execute(
+            "UPDATE jobs SET status = 'failed', error = ?, updated = ? WHERE pid = ? AND status IN ('queued', 'running')",
+            (self.ORPHANED_ERROR, time.time(), pid),
+        ).rowcount
+
+    def update(self, job_id: str, status: str, result: str | None = None, error: str | None = None) -> None:
+        self.connect().execute(
+            'UPDATE jobs SET status = ?, result = ?, error = ?, updated = ? WHERE id = ?',
+            (status, result, error, time.time(), job_id),
+        )
+
+    def delete(self, job_id: str) -> None:
+        self.connect().execute('DELETE FROM jobs WHERE id = ?', (job_id,))
+
+    def get(self, job_id: str) -> dict | None:
+        row = self.connect().execute(
+            'SELECT status, result, error, heartbeat FROM jobs WHERE id = ?', (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        status, result, error, heartbeat = row
+        if status in ('queued', 'running') and heartbeat < time.time() - self.stale_after:
+            # Воркер убит без child_exit (или мастер перезапущен): задачу никто не выполнит
+            self.connect().execute(
+                "UPDATE jobs SET status = 'failed', error = ?, updated = ? WHERE id = ? AND status = ?",
+                (self.ORPHANED_ERROR, time.time(), job_id, status),
+            )
+            status, error = 'failed', self.ORPHANED_ERROR
+        return {'status': status, 'result': result, 'error': error}
+
+    def wait(self, job_id: str, timeout: float, poll_interval: float = 0.2) -> dict | None:
+        """Long-poll: ждёт завершения задачи не дольше timeout секунд."""
+        deadline = time.monotonic() + timeout
+        while True:
+            job = self.get(job_id)
+            if job is None or job['status'] in ('done', 'failed') or time.monotonic() >= deadline:
+                return job
+            time.sleep(poll_interval)
+
+
+class JobRunner:
+    """Ограниченная очередь задач процесса и пул потоков, выполняющих handler.
+
+    Переполнение очереди — исключение QueueFull с оценкой времени до повтора.
+    Отдельный поток раз в heartbeat_interval секунд отмечает в store, что задачи
+    процесса ещё живы.
+    """
+
+    def __init__(
+        self,
+        store: JobStore,
+        handler: Callable[..., str],
+        max_queue: int = 8,
+        workers: int = 2,
+        name: str = 'job-runner',
+        on_wait: Callable[[float], None] | None = None,
+        heartbeat_interval: float = 5.0,
+    ):
+        self.store = store
+        self.heartbeat_interval = heartbeat_interval
+        self.on_wait = on_wait  # получает время ожидания задачи в очереди, с
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.name = name
+        self._queue: queue.Queue = queue.Queue(maxsize=max(1, max_queue))
+        self._lock = threading.Lock()
+        self._threads: list[threading.Thread] = []
+        self._heartbeat: threading.Thread | None = None
+        self._pid: int | None = None
+        self._avg_duration = 5.0  # сглаженное время выполнения задачи, с
+
+    def submit(self, *args) -> str:
+        """Ставит задачу в очередь и возвращает её идентификатор."""
+        self._ensure_started()
+        job_id = uuid.uuid4().hex
+        self.store.create(job_id)
+        try:
+            self._queue.put_nowait((job_id, args, time.monotonic()))
+        except queue.Full:
+            self.store.delete(job_id)
+            raise QueueFull(self.retry_after()) from None
+        return job_id
+
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    def retry_after(self) -> int:
+        """Оценка времени разбора текущей очереди, с."""
+        return max(1, math.ceil(self._queue.qsize() * self._avg_duration / self.workers))
+
+    def _ensure_started(self) -> None:
+        with self._lock:
+            if self._pid == os.getpid() and all(t.is_alive() for t in self._threads):
+                return
+            # После fork потоки родителя не существуют, очередь начинаем заново
+            if self._pid != os.getpid():
+                self._queue = queue.Queue(maxsize=self._queue.maxsize)
+            self._pid = os.getpid()
+            self._threads = [t for t in self._threads if t.is_alive()]
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._loop, name=f"{self.name}-{len(self._threads)}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            if self._heartbeat is None or not self._heartbeat.is_alive():
+                self._heartbeat = threading.Thread(target=self._beat, name=f"{self.name}-heartbeat", daemon=True)
+                self._heartbeat.start()
+
+    def _beat(self) -> None:
+        while True:
+            time.sleep(self.heartbeat_interval)
+            with suppress(sqlite3.OperationalError):
+                self.store.heartbeat(os.getpid())
+
+    def _loop(self) -> None:
+        while True:
+            job_id, args, enqueued_at = self._queue.get()
+            if self.on_wait is not None:
+                self.on_wait(time.monotonic() - enqueued_at)
+            started = time.perf_counter()
+            self.store.update(job_id, 'running')
+            try:
+                result = self.handler(*args)
+            except Exception as e:
+                self.store.update(job_id, 'failed', error=str(e))
+            else:
+                self.store.update(job_id, 'done', result=result)
+            finally:
+                self._avg_duration = 0.8 * self._avg_duration + 0.2 * (time.perf_counter() - started)
+                self._queue.task_done()
@@ -0,0 +1,162 @@
+"""Живая проверка с камеры: пропуск почти одинаковых кадров и трекинг предметов между кадрами."""
+
+import base64
+import json
+import time
+import uuid
+from collections import Counter
+from collections.abc import Iterable
+
+import cv2
+import numpy as np
+
+from serving.state import SqliteStore
+
+THUMBNAIL_SIZE = 64
+
+
+def frame_thumbnail(image: np.ndarray) -> np.ndarray:
+    """Маленькая серая копия кадра для сравнения кадров и оценки сдвига камеры."""
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    return cv2.resize(gray, (THUMBNAIL_SIZE, THUMBNAIL_SIZE), interpolation=cv2.INTER_AREA)
+
+
+def frame_change(previous: np.ndarray, current: np.ndarray) -> float:
+    """Среднее абсолютное различие миниатюр (0–255)."""
+    return float(np.mean(cv2.absdiff(previous, current)))
+
+
+def frame_shift(previous: np.ndarray, current: np.ndarray) -> tuple[float, float]:
+    """Сдвиг содержимого кадра относительно предыдущего в долях ширины/высоты (фазовая корреляция)."""
+    (dx, dy), _ = cv2.phaseCorrelate(previous.astype(np.float32), current.astype(np.float32))
+    return dx / THUMBNAIL_SIZE, dy / THUMBNAIL_SIZE
+
+
+def box_iou(a: list[float], b: list[float]) -> float:
+    inter_w = min(a[2], b[2]) - max(a[0], b[0])
+    inter_h = min(a[3], b[3]) - max(a[1], b[1])
+    if inter_w <= 0 or inter_h <= 0:
+        return 0.0
+    inter = inter_w * inter_h
+    return inter / ((a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter)
+
+
+class KitTracker:
+    """Треки предметов в координатах комплекта (кадр минус накопленный сдвиг камеры).
+
+    Детекция продлевает трек того же класса (или той же группы классов) с наибольшим
+    IoU не ниже iou_threshold, иначе открывает новый. Предмет засчитывается, когда его
+    трек подтверждён min_hits кадрами; класс трека — большинство голосов.
+    """
+
+    def __init__(
+        self,
+        state: dict | None = None,
+        iou_threshold: float = 0.3,
+        min_hits: int = 2,
+        groups: dict[str, str] | None = None,
+    ):
+        state = state or {}
+        self.tracks: list[dict] = state.get('tracks', [])
+        self.offset: list[float] = state.get('offset', [0.0, 0.0])
+        self.next_id: int = state.get('next_id', 1)
+        self.iou_threshold = iou_threshold
+        self.min_hits = min_hits
+        self.groups = groups or {}  # классы, которые модель путает между кадрами (большой/малый бинт)
+
+    def state(self) -> dict:
+        return {'tracks': self.tracks, 'offset': self.offset, 'next_id': self.next_id}
+
+    def move(self, dx: float, dy: float) -> None:
+        """Учитывает сдвиг содержимого кадра, оценённый по миниатюрам."""
+        self.offset = [self.offset[0] + dx, self.offset[1] + dy]
+
+    def update(self, detections: Iterable[tuple[str, list[float]]], frame: int) -> list[int]:
+        """Сопоставляет детекции кадра (класс, нормированный бокс кадра) с треками; возвращает id треков."""
+        ox, oy = self.offset
+        matched: set[int] = set()
+        track_ids = []
+        for cls_name, box in detections:
+            kit_box = [box[0] - ox, box[1] - oy, box[2] - ox, box[3] - oy]
+            group = self.groups.get(cls_name, cls_name)
+            best, best_iou = None, self.iou_threshold
+            for track in self.tracks:
+                if track['id'] in matched or self.groups.get(track['class'], track['class']) != group:
+                    continue
+                iou = box_iou(track['box'], kit_box)
+                if iou >= best_iou:
+                    best, best_iou = track, iou
+            if best is None:
+                best = {'id': self.next_id, 'class': cls_name, 'box': kit_box, 'hits': 0, 'votes': {}}
+                self.next_id += 1
+                self.tracks.append(best)
+            best['box'] = kit_box
+            best['hits'] += 1
+            best['last_frame'] = frame
+            best['votes'][cls_name] = best['votes'].get(cls_name, 0) + 1
+            best['class'] = max(best['votes'], key=best['votes'].get)
+            matched.add(best['id'])
+            track_ids.append(best['id'])
+        return track_ids
+
+    def pending(self, frame: int) -> bool:
+        """Есть треки, ещё не подтверждённые min_hits кадрами и виденные за последние min_hits кадров."""
+        return any(
+            track['hits'] < self.min_hits and track.get('last_frame', 0) > frame - self.min_hits
+            for track in self.tracks
+        )
+
+    def counts(self) -> Counter:
+        """Число подтверждённых предметов каждого класса."""
+        return Counter(track['class'] for track in self.tracks if track['hits'] >= self.min_hits)
+
+
+class LiveSessionStore(SqliteStore):
+    """Состояние сессий живой проверки (миниатюра кадра, треки), общее для воркеров."""
+
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS live_sessions (
+            id TEXT PRIMARY KEY,
+            state TEXT NOT NULL,
+            updated REAL NOT NULL
+        );
+    '''
+
+    def __init__(self, path, ttl: float = 600.0):
+        super().__init__(path)
+        self.ttl = ttl
+
+    def create(self) -> str:
+        session_id = uuid.uuid4().hex
+        now = time.time()
+        with self.transaction() as conn:
+            conn.execute('DELETE FROM live_sessions WHERE updated < ?', (now - self.ttl,))
+            conn.execute(
+                'INSERT INTO live_sessions (id, state, updated) VALUES (?, ?, ?)',
+                (session_id, json.dumps({'frame': 0}), now),
+            )
+        return session_id
+
+    def load(self, session_id: str) -> dict | None:
+        row = self.connect().execute(
+            'SELECT state, updated FROM live_sessions WHERE id = ?', (session_id,)
+        ).fetchone()
+        if row is None or time.time() - row[1] > self.ttl:
+            return None
+        state = json.loads(row[0])
+        if 'thumbnail' in state:
+            raw = base64.b64decode(state['thumbnail'])
+            state['thumbnail'] = np.frombuffer(raw, dtype=np.uint8).reshape(THUMBNAIL_SIZE, THUMBNAIL_SIZE)
+        return state
+
+    def save(self, session_id: str, state: dict) -> None:
+        state = dict(state)
+        if 'thumbnail' in state:
+            state['thumbnail'] = base64.b64encode(state['thumbnail'].tobytes()).decode('ascii')
+        self.connect().execute(
+            'UPDATE live_sessions SET state = ?, updated = ? WHERE id = ?',
+            (json.dumps(state), time.time(), session_id),
+        )
+
+    def delete(self, session_id: str) -> None:
+        self.connect().execute('DELETE FROM live_sessions WHERE id = ?', (session_id,))
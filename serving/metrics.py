@@ -0,0 +1,143 @@
+"""Метрики Prometheus сервиса, агрегируемые по всем воркерам gunicorn.
+
+Если задан PROMETHEUS_MULTIPROC_DIR (его выставляет gunicorn.conf.py), значения
+каждого процесса пишутся в файлы этого каталога и суммируются при выдаче /metrics.
+"""
+
+import os
+import time
+from collections.abc import Callable, Iterable, Iterator
+from contextlib import contextmanager
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from prometheus_client.core import Metric
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 40.0, 60.0, 120.0)
+
+STAGE_SECONDS = Histogram(
+    'medkit_stage_seconds',
+    'Длительность этапов обработки фото',
+    ['stage'],
+    buckets=LATENCY_BUCKETS,
+)
+QUEUE_WAIT_SECONDS = Histogram(
+    'medkit_queue_wait_seconds',
+    'Ожидание в очереди до начала обработки',
+    ['queue'],
+    buckets=LATENCY_BUCKETS,
+)
+BATCH_SIZE = Histogram(
+    'medkit_inference_batch_size',
+    'Размер батча одного вызова model.predict',
+    buckets=(1, 2, 3, 4, 6, 8, 12, 16, 32),
+)
+REQUESTS = Counter(
+    'medkit_requests_total',
+    'Итоги проверок фото',
+    ['outcome'],
+)
+INFERENCE_TIERS = Counter(
+    'medkit_inference_tier_total',
+    'Какой проход каскада принял решение',
+    ['tier'],
+)
+SHED_REQUESTS = Counter(
+    'medkit_shed_requests_total',
+    'Запросы, не допущенные контролем допуска (ответ 429)',
+    ['reason'],
+)
+ADMITTED_INFLIGHT = Gauge(
+    'medkit_admitted_inflight',
+    'Допущенные проверки воркера, которые выполняются или ждут в очереди',
+    multiprocess_mode='liveall',
+)
+COALESCED_REQUESTS = Counter(
+    'medkit_coalesced_requests_total',
+    'Повторы фото, получившие результат одновременной проверки того же фото',
+    ['source'],
+)
+DEGRADED_REQUESTS = Counter(
+    'medkit_degraded_requests_total',
+    'Проверки фото со сниженным уровнем качества из-за бюджета задержки',
+    ['quality'],
+)
+ROI_AREA_RATIO = Histogram(
+    'medkit_roi_area_ratio',
+    'Доля площади фото, на которой шёл полный проход в режиме ROI',
+    buckets=(0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0),
+)
+REJECTED_UPLOADS = Counter(
+    'medkit_rejected_uploads_total',
+    'Фото, отклонённые предпроверкой до инференса',
+    ['reason'],
+)
+LIVE_FRAMES = Counter(
+    'medkit_live_frames_total',
+    'Кадры живой проверки: с инференсом, пропущенные как почти не изменившиеся или отклонённые по качеству',
+    ['result'],
+)
+MODEL_VERSION = Gauge(
+    'medkit_model_version',
+    'Версия модели, активная хотя бы в одном процессе (1) или выведенная из работы (0)',
+    ['version'],
+    multiprocess_mode='livemax',
+)
+MODEL_SWAPS = Counter(
+    'medkit_model_swaps_total',
+    'Горячие замены модели по реестру версий',
+    ['result'],
+)
+MODEL_LOAD_SECONDS = Gauge(
+    'medkit_model_load_seconds',
+    'Время последней загрузки модели',
+    multiprocess_mode='mostrecent',
+)
+
+
+@contextmanager
+def observe_stage(stage: str) -> Iterator[None]:
+    """Замеряет длительность блока как этап stage."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.labels(stage).observe(time.perf_counter() - started)
+
+
+def queue_wait_observer(queue: str) -> Callable[[float], None]:
+    """Функция-приёмник времени ожидания в очереди queue."""
+    return QUEUE_WAIT_SECONDS.labels(queue).observe
+
+
+class CallbackCollector:
+    """Коллектор, метрики которого вычисляются при каждой выдаче /metrics."""
+
+    def __init__(self, callback: Callable[[], Iterable[Metric]]):
+        self.callback = callback
+
+    def collect(self) -> Iterable[Metric]:
+        return self.callback()
+
+
+def render_latest(extra_collectors: Iterable[CallbackCollector] = ()) -> tuple[bytes, str]:
+    """Текст метрик в формате Prometheus и его Content-Type."""
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        output = generate_latest(registry)
+    else:
+        output = generate_latest(REGISTRY)
+
+    extra = CollectorRegistry()
+    for collector in extra_collectors:
+        extra.register(collector)
+    return output + generate_latest(extra), CONTENT_TYPE_LATEST
@@ -0,0 +1,121 @@
+"""Реестр версий модели: каталог с весами по версиям и manifest.json с активной версией.
+
+    <registry>/
+        manifest.json           # {"active": "v2", "previous": "v1", "versions": {...}}
+        v1/best.pt
+        v2/best.pt              # рядом — экспортированные best.onnx, best_openvino_model/ ...
+
+Процессы сервиса периодически проверяют manifest.json и сами переключаются на активную
+версию; manifest переписывается атомарно (os.replace), так что читатель всегда видит
+целый файл. Откат — та же операция активации для предыдущей версии.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import time
+from collections.abc import Iterable
+from pathlib import Path
+
+
+class RegistryError(ValueError):
+    """Некорректная операция с реестром (нет версии, версия уже есть и т.п.)."""
+
+
+class ModelRegistry:
+    MANIFEST = 'manifest.json'
+
+    def __init__(self, root: str | Path):
+        self.root = Path(root)
+        self.manifest_path = self.root / self.MANIFEST
+
+    def manifest(self) -> dict:
+        try:
+            manifest = json.loads(self.manifest_path.read_text(encoding='utf-8'))
+        except FileNotFoundError:
+            manifest = {}
+        manifest.setdefault('active', None)
+        manifest.setdefault('previous', None)
+        manifest.setdefault('versions', {})
+        return manifest
+
+    def stamp(self) -> int | None:
+        """Метка изменения manifest.json для дешёвого опроса (None — файла нет)."""
+        try:
+            return self.manifest_path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def weights_path(self, version: str, manifest: dict | None = None) -> Path:
+        manifest = manifest or self.manifest()
+        if version not in manifest['versions']:
+            raise RegistryError(f"Версии {version} нет в реестре {self.root}")
+        return self.root / manifest['versions'][version]['weights']
+
+    def active(self) -> tuple[str, Path] | None:
+        """Активная версия и путь к её весам (None — реестр пуст)."""
+        manifest = self.manifest()
+        if manifest['active'] is None:
+            return None
+        return manifest['active'], self.weights_path(manifest['active'], manifest)
+
+    def add(self, version: str, weights: str | Path, note: str = '', artifacts: Iterable[str] = ()) -> Path:
+        """Копирует веса в каталог версии.
+
+        artifacts — суффиксы экспортированных рядом версий тех же весов ('.onnx',
+        '_openvino_model' ...): найденные копируются вместе с весами.
+        """
+        weights = Path(weights)
+        manifest = self.manifest()
+        if version in manifest['versions']:
+            raise RegistryError(f"Версия {version} уже есть в реестре")
+        if not weights.is_file():
+            raise RegistryError(f"Файл весов не найден: {weights}")
+
+        target_dir = self.root / version
+        target_dir.mkdir(parents=True, exist_ok=False)
+        shutil.copy2(weights, target_dir / weights.name)
+        for suffix in artifacts:
+            artifact = weights.with_name(weights.stem + suffix)
+            if artifact == weights or not artifact.exists():
+                continue
+            if artifact.is_dir():
+                shutil.copytree(artifact, target_dir / artifact.name)
+            else:
+                shutil.copy2(artifact, target_dir / artifact.name)
+
+        with open(weights, 'rb') as f:
+            digest = hashlib.file_digest(f, 'sha256').hexdigest()
+        manifest['versions'][version] = {
+            'weights': f'{version}/{weights.name}',
+            'sha256': digest,
+            'added': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'note': note,
+        }
+        self._write(manifest)
+        return target_dir / weights.name
+
+    def activate(self, version: str) -> str | None:
+        """Делает версию активной; возвращает прежнюю активную версию."""
+        manifest = self.manifest()
+        self.weights_path(version, manifest)
+        previous = manifest['active']
+        if previous != version:
+            manifest['previous'], manifest['active'] = previous, version
+            self._write(manifest)
+        return previous
+
+    def rollback(self) -> str:
+        """Возвращает предыдущую активную версию (повторный откат снова переключит вперёд)."""
+        previous = self.manifest()['previous']
+        if previous is None:
+            raise RegistryError("Нет предыдущей версии для отката")
+        self.activate(previous)
+        return previous
+
+    def _write(self, manifest: dict) -> None:
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.manifest_path.with_name(f'.{self.MANIFEST}.{os.getpid()}.tmp')
+        tmp_path.write_text(json.dumps(manifest, indent=2, ensure_ascii=False) + '\n', encoding='utf-8')
+        os.replace(tmp_path, self.manifest_path)
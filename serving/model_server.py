@@ -0,0 +1,210 @@
+"""Отдельный процесс инференса: воркеры gunicorn передают ему изображения через общую память.
+
+Протокол поверх Unix-сокета: сообщения JSON с 4-байтовым префиксом длины.
+Декодированные изображения запроса клиент кладёт в один сегмент shared memory
+и передаёт только его имя, формы и смещения — пиксели не сериализуются.
+"""
+
+import json
+import os
+import socket
+import socketserver
+import struct
+import threading
+import time
+import uuid
+from collections.abc import Callable
+from multiprocessing import resource_tracker, shared_memory
+from pathlib import Path
+
+import numpy as np
+import torch
+from ultralytics.engine.results import Results
+
+HEADER = struct.Struct('>I')
+
+
+def send_message(sock: socket.socket, message: dict) -> None:
+    body = json.dumps(message).encode('utf-8')
+    sock.sendall(HEADER.pack(len(body)) + body)
+
+
+def recv_message(stream) -> dict | None:
+    """Очередное сообщение из файла сокета; None — соединение закрыто."""
+    header = stream.read(HEADER.size)
+    if len(header) < HEADER.size:
+        return None
+    (length,) = HEADER.unpack(header)
+    return json.loads(stream.read(length))
+
+
+def parse_names(names: dict[str, str]) -> dict[int, str]:
+    """Имена классов из JSON (ключи — строки) в формат model.names."""
+    return {int(cls_id): name for cls_id, name in names.items()}
+
+
+def attach_shared_memory(name: str) -> shared_memory.SharedMemory:
+    """Подключение к чужому сегменту: удаляет его создатель, а не resource_tracker этого процесса."""
+    shm = shared_memory.SharedMemory(name=name)
+    resource_tracker.unregister(shm._name, 'shared_memory')
+    return shm
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self) -> None:
+        try:
+            while (message := recv_message(self.rfile)) is not None:
+                try:
+                    response = self.server.dispatch(message)
+                except Exception as e:
+                    response = {'error': str(e)}
+                send_message(self.request, response)
+        except ConnectionError:
+            # Клиент не дождался ответа (дедлайн запроса) и закрыл соединение
+            return
+
+
+class ModelServer(socketserver.ThreadingUnixStreamServer):
+    """Сервер модели: каждое соединение обслуживается своим потоком.
+
+    predict(images, imgsz, augment, deadline) возвращает для каждого изображения массив
+    (N, 6) [x1, y1, x2, y2, conf, cls] и описание модели, давшей ответ (version, names);
+    батчинг между запросами и отмена работы после deadline (time.time() или None) —
+    его забота. info() — описание текущей модели.
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        socket_path: str | Path,
+        predict: Callable[[list[np.ndarray], int, bool, float | None], tuple[list[np.ndarray], dict]],
+        info: Callable[[], dict],
+    ):
+        self.predict = predict
+        self.info = info
+        socket_path = Path(socket_path)
+        socket_path.parent.mkdir(parents=True, exist_ok=True)
+        socket_path.unlink(missing_ok=True)
+        super().__init__(str(socket_path), _Handler)
+
+    def dispatch(self, message: dict) -> dict:
+        if message['op'] == 'info':
+            return {**self.info(), 'pid': os.getpid()}
+        if message['op'] != 'predict':
+            raise ValueError(f"Неизвестная операция: {message['op']}")
+
+        shm = attach_shared_memory(message['shm'])
+        try:
+            # Копия из сегмента: предиктор ultralytics держит ссылки на входы после вызова
+            images = [
+                np.ndarray(shape, dtype=np.uint8, buffer=shm.buf, offset=offset).copy()
+                for shape, offset in zip(message['shapes'], message['offsets'], strict=True)
+            ]
+        finally:
+            shm.close()
+        results, model_info = self.predict(images, message['imgsz'], message['augment'], message.get('deadline'))
+        return {'results': [data.tolist() for data in results], **model_info}
+
+
+class ModelClient:
+    """Клиент сервера модели с интерфейсом model.predict() для кода приложения.
+
+    Соединение открывается отдельно для каждого потока и процесса; при пуле серверов
+    процесс выбирает сокет по своему pid. Пока сервер загружает модель, подключение
+    повторяется до connect_timeout секунд. version — версия модели, ответившей на
+    последний запрос этого потока (сервер может сменить модель между запросами).
+    """
+
+    def __init__(self, socket_paths: list[str | Path], connect_timeout: float = 120.0):
+        self.socket_paths = [str(path) for path in socket_paths]
+        self.connect_timeout = connect_timeout
+        self._local = threading.local()
+        self._version = None
+        self.names = parse_names(self._request({'op': 'info'})['names'])
+
+    @property
+    def version(self) -> str:
+        return getattr(self._local, 'version', self._version)
+
+    def current_version(self) -> str:
+        """Версия модели, активной на сервере сейчас (короткий запрос info)."""
+        return self._request({'op': 'info'})['version']
+
+    def _connect(self) -> tuple[socket.socket, object]:
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+
+        socket_path = self.socket_paths[os.getpid() % len(self.socket_paths)]
+        deadline = time.monotonic() + self.connect_timeout
+        while True:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                sock.connect(socket_path)
+                break
+            except OSError:
+                sock.close()
+                if time.monotonic() >= deadline:
+                    raise
+                time.sleep(0.5)
+        self._local.conn = (sock, sock.makefile('rb'))
+        self._local.pid = os.getpid()
+        return self._local.conn
+
+    def _request(self, message: dict, timeout: float | None = None) -> dict:
+        """Запрос к серверу; версия модели из ответа запоминается для текущего потока.
+
+        timeout — сколько ждать ответа (TimeoutError); соединение после этого
+        закрывается, чтобы опоздавший ответ не достался следующему запросу.
+        """
+        sock, stream = self._connect()
+        try:
+            sock.settimeout(timeout)
+            send_message(sock, message)
+            response = recv_message(stream)
+        except OSError:
+            self._local.conn = None
+            stream.close()
+            sock.close()
+            raise
+        if response is None:
+            self._local.conn = None
+            raise ConnectionError("Сервер модели закрыл соединение")
+        if 'error' in response:
+            raise RuntimeError(f"Сервер модели: {response['error']}")
+        self._local.version = self._version = response['version']
+        return response
+
+    def predict(
+        self, images: list[np.ndarray], imgsz: int, augment: bool, deadline: float | None = None, **_
+    ) -> list[Results]:
+        """Предсказания сервера; conf / iou / classes сервер берёт из тех же настроек приложения.
+
+        deadline (time.time()) — не ждать ответа дольше; сервер тоже снимает запрос
+        с очереди, если до него не дошло к этому моменту.
+        """
+        images = [np.ascontiguousarray(image, dtype=np.uint8) for image in images]
+        offsets = np.cumsum([0] + [image.nbytes for image in images]).tolist()
+        shm = shared_memory.SharedMemory(name=f"medkit-{uuid.uuid4().hex[:16]}", create=True, size=max(1, offsets[-1]))
+        try:
+            for image, offset in zip(images, offsets, strict=False):
+                np.ndarray(image.shape, dtype=np.uint8, buffer=shm.buf, offset=offset)[:] = image
+            response = self._request({
+                'op': 'predict',
+                'shm': shm.name,
+                'shapes': [image.shape for image in images],
+                'offsets': offsets[:-1],
+                'imgsz': imgsz,
+                'augment': augment,
+                'deadline': deadline,
+            }, timeout=None if deadline is None else max(0.001, deadline - time.time()))
+        finally:
+            shm.close()
+            shm.unlink()
+
+        names = parse_names(response['names'])
+        return [
+            Results(image, path='', names=names, boxes=torch.tensor(data, dtype=torch.float32).reshape(-1, 6))
+            for image, data in zip(images, response['results'], strict=True)
+        ]
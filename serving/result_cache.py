@@ -0,0 +1,98 @@
+"""Кэш готовых ответов по хэшу содержимого с вытеснением LRU и TTL."""
+
+import sqlite3
+import time
+from contextlib import suppress
+
+from serving.state import SqliteStore
+
+
+class ResultCache(SqliteStore):
+    """LRU-кэш JSON-ответов, общий для воркеров через файл SQLite.
+
+    Запись живёт не дольше ttl секунд с момента создания; при превышении
+    max_entries или max_bytes вытесняются давно не читавшиеся записи.
+    """
+
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS entries (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            created REAL NOT NULL,
+            accessed REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed);
+        CREATE TABLE IF NOT EXISTS counters (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        );
+    '''
+
+    def __init__(self, path, max_entries: int = 256, max_bytes: int = 256 * 1024 * 1024, ttl: float = 3600.0):
+        super().__init__(path)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+
+    def get(self, key: str) -> str | None:
+        try:
+            return self._get(key)
+        except sqlite3.OperationalError:
+            # Кэш — только оптимизация: при блокировке базы считаем промахом
+            return None
+
+    def put(self, key: str, value: str) -> None:
+        with suppress(sqlite3.OperationalError):
+            self._put(key, value)
+
+    def _get(self, key: str) -> str | None:
+        now = time.time()
+        with self.transaction() as conn:
+            row = conn.execute('SELECT value, created FROM entries WHERE key = ?', (key,)).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                if row is not None:
+                    conn.execute('DELETE FROM entries WHERE key = ?', (key,))
+                self.increment(conn, 'misses')
+                return None
+            conn.execute('UPDATE entries SET accessed = ? WHERE key = ?', (now, key))
+            self.increment(conn, 'hits')
+            return row[0]
+
+    def _put(self, key: str, value: str) -> None:
+        now = time.time()
+        size = len(value.encode('utf-8'))
+        if size > self.max_bytes:
+            return
+        with self.transaction() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO entries (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)',
+                (key, value, size, now, now),
+            )
+            conn.execute('DELETE FROM entries WHERE created < ?', (now - self.ttl,))
+            self._evict(conn)
+
+    def _evict(self, conn) -> None:
+        count, total = conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries').fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+        evicted = 0
+        for key, size in conn.execute('SELECT key, size FROM entries ORDER BY accessed').fetchall():
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            conn.execute('DELETE FROM entries WHERE key = ?', (key,))
+            count -= 1
+            total -= size
+            evicted += 1
+        self.increment(conn, 'evictions', evicted)
+
+    def stats(self) -> dict[str, int]:
+        count, total = self.connect().execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries').fetchone()
+        counters = self.counters()
+        return {
+            'hits': counters.get('hits', 0),
+            'misses': counters.get('misses', 0),
+            'evictions': counters.get('evictions', 0),
+            'entries': count,
+            'bytes': total,
+        }
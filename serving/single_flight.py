@@ -0,0 +1,127 @@
+"""Объединение одинаковых одновременных запросов (single-flight): работу выполняет первый, остальные ждут его результат."""
+
+import sqlite3
+import threading
+import time
+from collections.abc import Callable
+from concurrent.futures import Future
+from contextlib import suppress
+from typing import Any
+
+from serving import deadline as request_deadline
+from serving.state import SqliteStore
+
+
+class InflightStore(SqliteStore):
+    """Ключи, работа по которым сейчас идёт в каком-либо процессе контейнера.
+
+    Отметка старше max_age секунд считается оставленной упавшим процессом
+    (gunicorn убивает воркер по таймауту, не давая снять отметку).
+    """
+
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS inflight (
+            key TEXT PRIMARY KEY,
+            started REAL NOT NULL
+        );
+    '''
+
+    def __init__(self, path, max_age: float = 120.0):
+        super().__init__(path)
+        self.max_age = max_age
+
+    def claim(self, key: str) -> bool:
+        """Отмечает key как выполняемый; False — его уже выполняет другой процесс."""
+        now = time.time()
+        try:
+            with self.transaction() as conn:
+                conn.execute('DELETE FROM inflight WHERE started < ?', (now - self.max_age,))
+                cursor = conn.execute('INSERT OR IGNORE INTO inflight (key, started) VALUES (?, ?)', (key, now))
+                return cursor.rowcount == 1
+        except sqlite3.OperationalError:
+            # Объединение — только оптимизация: при блокировке базы работаем сами
+            return True
+
+    def held(self, key: str) -> bool:
+        try:
+            row = self.connect().execute(
+                'SELECT 1 FROM inflight WHERE key = ? AND started >= ?', (key, time.time() - self.max_age)
+            ).fetchone()
+        except sqlite3.OperationalError:
+            return False
+        return row is not None
+
+    def release(self, key: str) -> None:
+        with suppress(sqlite3.OperationalError):
+            self.connect().execute('DELETE FROM inflight WHERE key = ?', (key,))
+
+
+class SingleFlight:
+    """Одновременные вызовы с одинаковым ключом выполняются один раз.
+
+    Потоки процесса, пришедшие с ключом, который уже выполняется, получают результат
+    первого (лидера) через Future — вместе с его исключением. Исключение только
+    DeadlineExceeded лидера (у него бюджет мог быть меньше): ожидающий, у которого время
+    осталось, выполняет работу сам. Между процессами лидер отмечает ключ в store; процесс,
+    заставший отметку, ждёт её снятия и берёт результат через lookup (общий кэш), а если
+    его там нет — выполняет работу сам. Ожидание ограничено дедлайном запроса и max_wait секундами.
+    """
+
+    def __init__(self, store: InflightStore | None = None, poll: float = 0.05, max_wait: float = 120.0):
+        self.store = store
+        self.poll = poll
+        self.max_wait = max_wait
+        self._inflight: dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def run(self, key: str, compute: Callable[[], Any], lookup: Callable[[], Any] = lambda: None) -> tuple[Any, str | None]:
+        """Результат для key и откуда он: None — выполнен здесь, 'thread' — другим потоком, 'process' — другим процессом."""
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                # Запущенный Future нельзя отменить: ожидающий по дедлайну не снимет его у остальных
+                future.set_running_or_notify_cancel()
+                self._inflight[key] = future
+        if not leader:
+            try:
+                return request_deadline.wait(future), 'thread'
+            except request_deadline.DeadlineExceeded:
+                deadline = request_deadline.current()
+                if not future.done() or (deadline is not None and deadline.remaining() <= 0):
+                    raise
+            return self._run_exclusive(key, compute, lookup)
+
+        try:
+            result = self._run_exclusive(key, compute, lookup)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result[0])
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+        return result
+
+    def _run_exclusive(self, key: str, compute: Callable[[], Any], lookup: Callable[[], Any]) -> tuple[Any, str | None]:
+        if self.store is None:
+            return compute(), None
+
+        give_up = time.monotonic() + self.max_wait
+        while not self.store.claim(key):
+            while self.store.held(key):
+                if time.monotonic() >= give_up:
+                    return compute(), None
+                request_deadline.check('single_flight')
+                time.sleep(self.poll)
+            # Лидер другого процесса закончил: его результат уже в общем кэше
+            result = lookup()
+            if result is not None:
+                return result, 'process'
+
+        try:
+            return compute(), None
+        finally:
+            self.store.release(key)
@@ -0,0 +1,62 @@
+"""Общее для воркеров gunicorn состояние в локальной базе SQLite."""
+
+import os
+import sqlite3
+import threading
+from collections.abc import Iterator
+from contextlib import contextmanager
+from pathlib import Path
+
+
+class SqliteStore:
+    """База SQLite на локальном диске, общая для всех процессов контейнера.
+
+    Соединение создаётся отдельно для каждого потока и процесса (после fork
+    соединения родителя использовать нельзя). Подклассы задают схему в SCHEMA.
+    """
+
+    SCHEMA = ''
+
+    def __init__(self, path: str | Path, timeout: float = 10.0):
+        self.path = Path(path)
+        self.timeout = timeout
+        self._local = threading.local()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+    def connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+
+        conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        if self.SCHEMA:
+            conn.executescript(self.SCHEMA)
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """Транзакция с блокировкой на запись сразу (BEGIN IMMEDIATE)."""
+        conn = self.connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    def increment(self, conn: sqlite3.Connection, name: str, value: int = 1) -> None:
+        """Увеличивает общий счётчик (таблица counters должна быть в SCHEMA)."""
+        conn.execute(
+            'INSERT INTO counters (name, value) VALUES (?, ?) '
+            'ON CONFLICT(name) DO UPDATE SET value = value + excluded.value',
+            (name, value),
+        )
+
+    def counters(self) -> dict[str, int]:
+        rows = self.connect().execute('SELECT name, value FROM counters').fetchall()
+        return dict(rows)
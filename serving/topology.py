@@ -0,0 +1,138 @@
+"""Топология процессов и потоков: воркеры gunicorn, потоки torch / OpenCV / BLAS.
+
+Каждый воркер держит свою копию модели, а PyTorch по умолчанию занимает все ядра,
+поэтому воркеры × потоки запросов × потоки torch легко превышают квоту CPU контейнера.
+Здесь одна политика выводит все числа из лимита CPU cgroup; явные переменные окружения
+и файл, записанный scripts.tune_topology, имеют приоритет.
+"""
+
+import json
+import math
+import os
+from contextlib import suppress
+from pathlib import Path
+
+# Переменные, которые читают OpenMP / OpenBLAS / MKL при загрузке библиотек
+BLAS_ENV_VARS = ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS', 'NUMEXPR_NUM_THREADS')
+
+
+class Topology:
+    """Разбиение CPU: процессы gunicorn, потоки запросов и потоки инференса в каждом воркере."""
+
+    def __init__(self, cpus: float, workers: int, threads: int, inference_threads: int, source: str):
+        self.cpus = cpus
+        self.workers = workers
+        self.threads = threads
+        self.inference_threads = inference_threads
+        self.source = source  # policy / file / env — откуда взяты числа
+
+    def as_dict(self) -> dict:
+        return {
+            'cpus': self.cpus,
+            'workers': self.workers,
+            'threads': self.threads,
+            'inference_threads': self.inference_threads,
+        }
+
+    def __str__(self) -> str:
+        return (f"cpu_limit={self.cpus:g} workers={self.workers} threads={self.threads} "
+                f"inference_threads={self.inference_threads} (source: {self.source})")
+
+
+def cpu_limit() -> float:
+    """Доступные процессу CPU: минимум из квоты cgroup (v2 или v1) и маски affinity."""
+    available = float(len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count() or 1)
+
+    quota = None
+    with suppress(OSError, ValueError):
+        limit, period = Path('/sys/fs/cgroup/cpu.max').read_text().split()
+        if limit != 'max':
+            quota = int(limit) / int(period)
+    if quota is None:
+        with suppress(OSError, ValueError):
+            limit = int(Path('/sys/fs/cgroup/cpu/cpu.cfs_quota_us').read_text())
+            period = int(Path('/sys/fs/cgroup/cpu/cpu.cfs_period_us').read_text())
+            if limit > 0 and period > 0:
+                quota = limit / period
+
+    return min(available, quota) if quota else available
+
+
+def plan(cpus: float, max_workers: int = 4, inference_threads: int = 2, batch_size: int = 1) -> Topology:
+    """Политика по умолчанию.
+
+    Воркеров — столько, чтобы каждому досталось inference_threads ядер (не больше
+    max_workers: каждый воркер — отдельная копия модели в памяти). Оставшиеся ядра
+    делятся между потоками torch воркеров. Потоков gunicorn хватает, чтобы собирать
+    батч; если батчинга нет, потоки запросов сами вызывают predict, и потоки torch
+    делятся ещё и между ними.
+    """
+    cores = max(1, math.floor(cpus))
+    workers = max(1, min(max_workers, cores // max(1, inference_threads)))
+    threads = max(2, batch_size)
+    per_worker = max(1, cores // workers)
+    if batch_size <= 1:
+        per_worker = max(1, per_worker // threads)
+    return Topology(cpus, workers, threads, per_worker, 'policy')
+
+
+def load_file(path: Path) -> dict:
+    """Топология, сохранённая scripts.tune_topology ({} если файла нет)."""
+    try:
+        return json.loads(Path(path).read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return {}
+
+
+def resolve(topology_file: Path | None = None) -> Topology:
+    """Итоговая топология: GUNICORN_WORKERS / GUNICORN_THREADS / INFERENCE_THREADS > файл > политика."""
+    cpus = cpu_limit()
+    topology = plan(
+        cpus,
+        max_workers=int(os.environ.get('MAX_WORKERS', 4)),
+        inference_threads=int(os.environ.get('INFERENCE_THREADS_PER_WORKER', 2)),
+        batch_size=int(os.environ.get('INFERENCE_BATCH_SIZE', 4)),
+    )
+
+    tuned = load_file(topology_file) if topology_file else {}
+    # Файл подобран под другой лимит CPU — он не подходит этой машине
+    if tuned and tuned.get('cpus') == max(1, math.floor(cpus)):
+        topology.workers = int(tuned.get('workers', topology.workers))
+        topology.threads = int(tuned.get('threads', topology.threads))
+        topology.inference_threads = int(tuned.get('inference_threads', topology.inference_threads))
+        topology.source = f'file {topology_file}'
+
+    overrides = {
+        'workers': os.environ.get('GUNICORN_WORKERS'),
+        'threads': os.environ.get('GUNICORN_THREADS'),
+        'inference_threads': os.environ.get('INFERENCE_THREADS'),
+    }
+    overridden = [name for name, value in overrides.items() if value]
+    for name in overridden:
+        setattr(topology, name, max(1, int(overrides[name])))
+    if overridden:
+        topology.source = 'env' if topology.source == 'policy' else f'{topology.source} + env'
+    return topology
+
+
+def export_env(topology: Topology) -> None:
+    """Выставляет число потоков для процессов, которые ещё не загрузили torch / numpy.
+
+    Вызывается из gunicorn.conf.py до импорта приложения; уже заданные значения не трогает.
+    """
+    os.environ.setdefault('INFERENCE_THREADS', str(topology.inference_threads))
+    for name in BLAS_ENV_VARS:
+        os.environ.setdefault(name, str(topology.inference_threads))
+
+
+def apply_thread_limits(inference_threads: int) -> None:
+    """Ограничивает пулы потоков torch и OpenCV в текущем процессе."""
+    import cv2
+    import torch
+
+    torch.set_num_threads(inference_threads)
+    # Межоперационный пул можно настроить только до первой параллельной операции
+    with suppress(RuntimeError):
+        torch.set_num_interop_threads(1)
+    # Параллелизм между запросами дают потоки gunicorn; внутри OpenCV — один поток
+    cv2.setNumThreads(1)